@@ -1,20 +1,53 @@
+import importlib
+import json
+import lzma
+import mmap
 import os
 import pickle
+import shutil
+import struct
 import sys
+import tempfile
 import time
 import traceback
+import zlib
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List
 
-import maya.cmds as mc
 
+class LazyModule:
+    """
+    Stands in for a module and imports it on first attribute access. Keeps the data layer and file I/O
+    (DataContainer, DataWrapper.load/save, XadReader/XadWriter, LibraryIndex) importable outside of Maya
+    """
+
+    def __init__(self, moduleName):
+        self.moduleName = moduleName
+        self.module = None
+
+    def __getattr__(self, attr):
+        if self.module is None:
+            self.module = importlib.import_module(self.moduleName)
+        return getattr(self.module, attr)
+
+
+om = LazyModule("maya.api.OpenMaya")
+oma = LazyModule("maya.api.OpenMayaAnim")
+mc = LazyModule("maya.cmds")
 # Structure Version
-structVersion = 1.0
+structVersion = 1.1
+# Older structure versions DataContainer converts when unpickled
+legacyStructVersions = (1.0,)
+# Structure version of the indexed binary .xad format written by XadWriter
+binaryStructVersion = 2
 paieVersion = '1.3.3'
 
 platformCase = None
 if sys.platform == "win32" or sys.platform == "win64":
     platformCase = "ms"
-elif sys.platform == "linux2":
+elif sys.platform.startswith("linux"):
     platformCase = "gnu"
 elif sys.platform == "darwin":
     platformCase = "apple"
@@ -29,15 +62,137 @@ global gGuiRef
 # 2 = time markers
 debugger = 0
 
+# 1 = read/write animCurves in bulk through OpenMaya (falls back to maya.cmds per attribute where it can't)
+# 0 = maya.cmds only
+apiEngine = 1
+
+# 1 = share attribute lists between nodes of the same rig through SchemaCache, 0 = query every node.
+# Only used with the OpenMaya engine, as locks are read from its plugs
+schemaCaching = 1
+
+# Bytes of decoded files importData keeps in memory for repeated imports (see ClipCache). 0 = no caching
+clipCacheBudget = 64 * 1024 * 1024
+
+# Format DataWrapper.save writes by default:
+# 1 = pickled DataContainer
+# 2 = indexed binary format (see XadWriter)
+saveFormat = 1
+
+# Compression of curve blocks in the binary format: None, 'zlib' or 'lzma', at level 0-9
+saveCompression = None
+saveCompressionLevel = 6
+
+# Evaluation manager mode importData/exportData switch to with fast=True ('off' = DG). None leaves it alone
+fastEvaluationMode = 'off'
+
+# Progress notifiers update at most this many times per second
+progressRate = 4
+
+# Answers to dialogs by policy name, for non-interactive runs. None = ask the user.
+# Answered dialogs are logged to dialogLog
+dialogPolicies = None
+dialogLog = []
+
+# Policies of batch runs, unless the manifest or command line overrides them
+batchDialogPolicies = {
+    'overwriteFile': "Yes",
+    'overwriteKeys': "Yes",
+    'framerateMismatch': "Yes",
+    'matchRotateOrder': "Yes",
+}
+
+# Threads writing files in the background when exporting one file per namespace
+exportThreads = 4
+
+# Threads decompressing curve blocks on load. zlib and lzma release the GIL while working
+decodeThreads = min(8, os.cpu_count() or 1)
+
+
+def maya_useNewAPI():
+    """Lets Maya load this module as a Python API 2.0 plugin for PaieApiEdit"""
+    pass
+
+
+class PaieApiEdit:
+    """
+    Undoable command running a bulk OpenMaya edit queued by DataWrapper.
+    Takes the name of the module holding the queued edit as its only argument, as Maya
+    imports the plugin as a module of its own.
+    The om.MPxCommand subclass is only built once the plugin registers, so this module imports without Maya
+    """
+    commandName = "paieApiEdit"
+    pendingEdit = None
+    commandClass = None
 
-class DataWrapper:
     def __init__(self):
+        om.MPxCommand.__init__(self)
+        self.dgMod = None
+        self.animChange = None
+
+    @classmethod
+    def getCommandClass(cls):
+        if cls.commandClass is None:
+            cls.commandClass = type("PaieApiEditCommand", (cls, om.MPxCommand), {})
+        return cls.commandClass
+
+    @classmethod
+    def creator(cls):
+        return cls.getCommandClass()()
+
+    def isUndoable(self):
+        return True
+
+    def doIt(self, args):
+        owner = sys.modules[args.asString(0)].PaieApiEdit
+        edit = owner.pendingEdit
+        owner.pendingEdit = None
+
+        if edit is None:
+            raise RuntimeError("# PaieApiEdit.doIt >> No edit queued")
+
+        self.dgMod = om.MDGModifier()
+        self.animChange = oma.MAnimCurveChange()
+        try:
+            edit(self.dgMod, self.animChange)
+        except:
+            self.undoIt()
+            raise
+
+    def redoIt(self):
+        self.dgMod.doIt()
+        self.animChange.redoIt()
+
+    def undoIt(self):
+        self.animChange.undoIt()
+        self.dgMod.undoIt()
+
+
+def initializePlugin(plugin):
+    om.MFnPlugin(plugin, "PAIE", paieVersion).registerCommand(PaieApiEdit.commandName, PaieApiEdit.creator)
+
+
+def uninitializePlugin(plugin):
+    om.MFnPlugin(plugin).deregisterCommand(PaieApiEdit.commandName)
+
+
+class DataWrapper:
+    def __init__(self, useApi=None):
         self.dataObj = None
 
+        if useApi is None:
+            useApi = apiEngine
+        self.useApi = useApi
+
     def clear(self):
         self.__dict__.clear()
 
-    def load(self, filepath):
+    def load(self, filepath, namespace=None, objNames=None):
+        """
+        filepath:   file to load
+        namespace:  only load this namespace from the file
+        objNames:   only load objects with these names (no path or namespace)
+        The binary format only decodes the chosen objects. Pickles are loaded in full and then filtered
+        """
         self.loadedVersion = None
         try:
             file = open(filepath, 'rb')
@@ -47,38 +202,105 @@ class DataWrapper:
             )
         else:
             try:
-                pickled = pickle.load(file)
-                self.loadedVersion = pickled.structVersion
-
-                if pickled.structVersion != structVersion:
-                    raise Exception
+                if XadReader.isXad(file):
+                    reader = XadReader(file)
+                    self.loadedVersion = reader.structVersion
+                    self.dataObj = reader.readContainer(namespace, objNames)
                 else:
-                    self.dataObj = pickled
+                    pickled = pickle.load(file)
+                    self.loadedVersion = pickled.structVersion
+
+                    if pickled.structVersion != structVersion and pickled.structVersion not in legacyStructVersions:
+                        raise Exception
+                    else:
+                        self.dataObj = pickled
+                        self.dataObj.filterData(namespace, objNames)
 
             except (Exception, AttributeError):
                 file.close()
                 print(
-                    "# DataWrapper.load >> Imported pickle dosn't match current class version. This feature is not supported yet"
+                    "# DataWrapper.load >> Imported pickle dosn't match current class version. "
+                    "This feature is not supported yet"
                 )
                 return 0
 
         file.close()
         return self.hasContent()
 
-    def save(self, filepath):
+    def loadCached(self, filepath, namespace=None, objNames=None):
+        """
+        Like load(), through the session ClipCache: loading the same objects of an unchanged file again doesn't
+        touch the disk. Only what load() decoded for namespace and objNames is cached. Falls back to load() when
+        caching is off or the file is larger than paie.clipCacheBudget
+        """
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            stat = None
+
+        if not clipCacheBudget or stat is None or stat.st_size > clipCacheBudget:
+            return self.load(filepath, namespace, objNames)
+
+        entry = ClipCache.get(filepath, stat, namespace, objNames)
+        if entry is None:
+            if not self.load(filepath, namespace, objNames):
+                return 0
+            entry = ClipCache.add(filepath, stat, namespace, objNames, self.dataObj, self.loadedVersion)
+
+        self.loadedVersion = entry['loadedVersion']
+        self.dataObj = ClipCache.getView(entry['dataObj'], namespace, objNames)
+        return self.hasContent()
+
+    def save(self, filepath, fileFormat=None, compression=None, compressionLevel=None, progress=None):
+        """
+        filepath:           path to write to
+        fileFormat:         1 = pickled DataContainer, 2 = indexed binary format (Defaults to paie.saveFormat)
+        compression:        'none', 'zlib' or 'lzma' for the binary format (Defaults to paie.saveCompression)
+        compressionLevel:   0-9 (Defaults to paie.saveCompressionLevel)
+        progress:           ProgressHandler reporting written objects in a "write" phase. None reports nothing,
+                            which keeps save free of maya.cmds calls for threads
+        """
         if self.dataObj is None:
             print("# DataWrapper.save >> No content to save")
             return
 
+        if fileFormat is None:
+            fileFormat = saveFormat
+
         try:
-            with open(filepath, 'wb') as file:
-                pickle.dump(self.dataObj, file, -1)
-                self.dataObj.clear()
-                print('# DataWrapper.save >> File was successfully written at: ' + filepath)
+            if fileFormat == 2:
+                writer = self.getXadWriter(filepath, self.dataObj.content['header'], compression, compressionLevel)
+                if progress is not None:
+                    progress.setPhase("write", sum([len(objs) for objs in self.dataObj.content['data'].values()]))
+                try:
+                    for namespace in self.dataObj.content['data']:
+                        for objID in self.dataObj.content['data'][namespace]:
+                            if progress is not None:
+                                progress.printStatus()
+                            writer.addObject(namespace, objID, self.dataObj.content['data'][namespace][objID])
+                except:
+                    writer.abort()
+                    raise
+                writer.close()
+            else:
+                with open(filepath, 'wb') as file:
+                    pickle.dump(self.dataObj, file, -1)
+
+            self.dataObj.clear()
+            ClipCache.invalidate(filepath)
+            print('# DataWrapper.save >> File was successfully written at: ' + filepath)
         except Exception as e:
             print(e)
             raise Exception('# DataWrapper.save >> Could not write to file')
 
+    def getXadWriter(self, filepath, header, compression=None, compressionLevel=None):
+        if compression is None:
+            compression = saveCompression
+        if compressionLevel is None:
+            compressionLevel = saveCompressionLevel
+
+        return XadWriter(filepath, header, compression, compressionLevel)
+
     def hasContent(self):
         returnVal = 0
         try:
@@ -128,7 +350,10 @@ class DataWrapper:
         else:
             return '[Username]'
 
-    def getData(self, selList, startFrame, endFrame, dataType, attrsType, comments):
+    def getData(
+            self, selList, startFrame, endFrame, dataType, attrsType, comments, streamPath=None, compression=None,
+            selIndex=None
+    ):
         """
         selList:    			List of selected objects
         startFrame: 			you guess
@@ -136,80 +361,207 @@ class DataWrapper:
         dataType:   			'pose'/'anim'
         attrsType:  			'all'/'keyable' (save all attributes or only keyables)
         comments:   			string
+        streamPath: 			write each object to this file in the binary format as soon as it's sampled
+                    			instead of keeping it in memory. self.dataObj then only holds the header
+        compression:			compression of streamed files as in DataWrapper.save
+        selIndex:   			SelectionIndex of selList, if already built
         """
         dataDict = {'header': {}, 'data': {}}
 
         # writing header:
-        filetype = dataType
-        framerate = self.getFramerate()
-        exportedBy = self.getUser()
-        dateOfExport = mc.date(format="hh:mm-DD/MM/YY")
-        if dataType == 'pose':
-            clipLength = 1
-        else:
-            clipLength = (endFrame - startFrame) + 1
-        originalStartframe = startFrame
-
-        dataDict['header'] = {'paieVersion': paieVersion, 'filetype': filetype, 'framerate': framerate,
-                              'exportedBy': exportedBy, 'dateOfExport': dateOfExport,
-                              'structVersion': structVersion, 'clipLength': clipLength,
-                              'startframe': originalStartframe,
-                              'comments': comments}
+        dataDict['header'] = self.getHeader(startFrame, endFrame, dataType, comments)
 
         namespaceDict = {}
 
+        if selIndex is None:
+            selIndex = SelectionIndex(selList)
+
+        # Attributes that can hold keys, from one pass over the connections of the selection
+        animatedAttrs = {}
+        if dataType == 'anim':
+            animatedAttrs = self.getAnimatedAttrs(selList)
+
+        writer = None
+        if streamPath is not None:
+            writer = self.getXadWriter(streamPath, dataDict['header'], compression)
+
         # Initializing progressBar
-        progress = ProgressHandler(len(selList), "Exporting Data")
+        progress = ProgressHandler(len(selList), "Exporting Data", "query")
         progress.printStatus()
 
         # Handle selection list: (get shapenodes for each transform.. f.x.)
 
         # Handle namespaces
-        iter = range(0, len(selList))
-        for i in iter:
-
-            # Update progress
-            progress.printStatus()
-
-            objWithNamespace = selList[i].split("|")[-1]  # gets last obj in path
-            split = objWithNamespace.split(":")
+        try:
+            iter = range(0, len(selList))
+            for i in iter:
 
-            if len(split) == 1:  # No namespace
-                if "none" not in namespaceDict:
-                    namespaceDict["none"] = {}
+                # Update progress
+                progress.printStatus()
 
-                namespaceDict["none"][i] = self.getObjDict(selList[i], startFrame, endFrame, dataType, attrsType)
-            else:  # Namespaces
-                # get whole namespace
-                objName = objWithNamespace.split(":")[-1]  # strips obj from namespace
-                namespace = objWithNamespace[: len(objName) * -1]  # gets full namespace
+                namespace = selIndex.namespaces[i]
 
-                if namespace not in namespaceDict:
-                    namespaceDict[namespace] = {}
+                objDict = self.getObjDict(
+                    selList[i], startFrame, endFrame, dataType, attrsType, selIndex.strippedPaths[i],
+                    animatedAttrs.get(selList[i])
+                )
 
-                namespaceDict[namespace][i] = self.getObjDict(selList[i], startFrame, endFrame, dataType, attrsType)
+                if writer is not None:
+                    writer.addObject(namespace, i, objDict)
+                else:
+                    if namespace not in namespaceDict:
+                        namespaceDict[namespace] = {}
+
+                    namespaceDict[namespace][i] = objDict
+
+            if writer is not None:
+                progress.setPhase("write", 1)
+                progress.printStatus()
+                if writer.index:
+                    writer.close()
+                    ClipCache.invalidate(streamPath)
+                    print('# DataWrapper.getData >> File was successfully written at: ' + streamPath)
+                else:
+                    writer.abort()
+        except BaseException:
+            # Includes cancelling through the progress window
+            if writer is not None:
+                writer.abort()
+            raise
+        finally:
+            # Finishing progressBar
+            progress.finish()
 
         dataDict['data'] = namespaceDict
 
-        # Finishing progressBar
-        progress.finish()
-
         self.dataObj = DataContainer(dataDict)
         self.dataObj.structVersion = structVersion
+
+        if writer is not None:
+            return int(len(writer.index) != 0)
         return self.dataObj.hasContent()
 
-    def getObjDict(self, objFullPath, startFrame, endFrame, dataType, attrsType):
+    def getDataSplit(
+            self, selList, startFrame, endFrame, dataType, attrsType, comments, namespacePaths, fileFormat=None,
+            compression=None, selIndex=None
+    ):
+        """
+        Samples selList like getData, in a single pass, but writes the objects of each namespace to a file of
+        their own as soon as the namespace is sampled. Files are written on a pool of paie.exportThreads threads
+        while the next namespace is sampled.
+        namespacePaths: namespace -> path to write to. Objects in namespaces missing from it are skipped
+        Returns a list of (written path, contents as returned by getIndexContents)
+        """
+        if selIndex is None:
+            selIndex = SelectionIndex(selList)
+
+        header = self.getHeader(startFrame, endFrame, dataType, comments)
+
+        # Selection indexes per namespace. objIDs restart at 0 in each file, in selection order
+        namespaceObjs = {}
+        for i in range(len(selList)):
+            if selIndex.namespaces[i] in namespacePaths:
+                namespaceObjs.setdefault(selIndex.namespaces[i], []).append(i)
+
+        # Attributes that can hold keys, from one pass over the connections of the selection
+        animatedAttrs = {}
+        if dataType == 'anim':
+            animatedAttrs = self.getAnimatedAttrs(selList)
+
+        # Initializing progressBar
+        progress = ProgressHandler(sum([len(objs) for objs in namespaceObjs.values()]), "Exporting Data", "query")
+        progress.printStatus()
+
+        writtenFiles = []
+        try:
+            with ThreadPoolExecutor(exportThreads) as pool:
+                futures = []
+                for namespace in namespaceObjs:
+                    objDicts = {}
+                    for objID, i in enumerate(namespaceObjs[namespace]):
+                        # Update progress
+                        progress.printStatus()
+
+                        objDicts[objID] = self.getObjDict(
+                            selList[i], startFrame, endFrame, dataType, attrsType, selIndex.strippedPaths[i],
+                            animatedAttrs.get(selList[i])
+                        )
+
+                    futures.append(pool.submit(
+                        self.writeNamespace, namespacePaths[namespace], header, namespace, objDicts, fileFormat,
+                        compression
+                    ))
+
+                progress.setPhase("write", len(futures))
+                for future in futures:
+                    progress.printStatus()
+                    writtenFiles.append(future.result())
+        finally:
+            # Finishing progressBar
+            progress.finish()
+
+        return writtenFiles
+
+    def writeNamespace(self, filepath, header, namespace, objDicts, fileFormat=None, compression=None):
+        """
+        Saves objDicts of a single namespace to filepath. Doesn't touch the scene or report progress, so it's safe
+        in a thread. getDataSplit reports written files from the main thread.
+        Returns (filepath, contents as returned by getIndexContents)
+        """
+        wrapperObj = DataWrapper(self.useApi)
+        wrapperObj.dataObj = DataContainer({'header': dict(header), 'data': {namespace: objDicts}})
+        wrapperObj.dataObj.structVersion = structVersion
+        contents = wrapperObj.getIndexContents()
+        wrapperObj.save(filepath, fileFormat, compression)
+
+        return filepath, contents
+
+    def getIndexContents(self):
+        """Header, namespaces and object names of dataObj, for LibraryIndex.update to index unread"""
+        data = self.dataObj.content['data']
+        return {
+            'header': dict(self.dataObj.content['header']),
+            'namespaces': list(data),
+            'objects': {ns: [data[ns][objID]['objData']['fullPath'] for objID in data[ns]] for ns in data},
+            'structVersion': self.dataObj.structVersion,
+        }
+
+    def getHeader(self, startFrame, endFrame, dataType, comments):
+        filetype = dataType
+        framerate = self.getFramerate()
+        exportedBy = self.getUser()
+        dateOfExport = mc.date(format="hh:mm-DD/MM/YY")
+        if dataType == 'pose':
+            clipLength = 1
+        else:
+            clipLength = (endFrame - startFrame) + 1
+        originalStartframe = startFrame
+
+        return {'paieVersion': paieVersion, 'filetype': filetype, 'framerate': framerate,
+                'exportedBy': exportedBy, 'dateOfExport': dateOfExport,
+                'structVersion': structVersion, 'clipLength': clipLength,
+                'startframe': originalStartframe,
+                'comments': comments}
+
+    def getObjDict(
+            self, objFullPath, startFrame, endFrame, dataType, attrsType, fullStrippedPath=None, animatedAttrs=None
+    ):
+        """
+        animatedAttrs: attributes that can hold keys, as found by getAnimatedAttrs. The others are stored as pose
+                       values without querying keys. None queries keys of every attribute
+        """
         objDict = {'objData': {}, 'objAttrs': {}, }
 
         # set object name
         # strip from namespaces
 
-        fullStrippedPath = ""
-        for lvl in objFullPath.split("|")[1:]:
-            strippedObj = lvl.split(":")[-1]
-            fullStrippedPath += "|" + strippedObj
+        if fullStrippedPath is None:
+            fullStrippedPath = ""
+            for lvl in objFullPath.split("|")[1:]:
+                strippedObj = lvl.split(":")[-1]
+                fullStrippedPath += "|" + strippedObj
 
-        objDict['objData']['fullPath'] = fullStrippedPath
+        objDict['objData']['fullPath'] = sys.intern(fullStrippedPath)
 
         # Set rotation order
         ''' Rotate order meaning:
@@ -221,13 +573,31 @@ class DataWrapper:
         5: "zyx"
         '''
 
-        if mc.objExists(objFullPath + '.rotateOrder'):
+        # The cache reads locks from OpenMaya plugs, so it's only used with useApi
+        schema = None
+        if schemaCaching and self.useApi:
+            schema, nodeObj = SchemaCache.get(objFullPath)
+
+        if schema is not None:
+            hasRotateOrder = schema['hasRotateOrder']
+        else:
+            hasRotateOrder = mc.objExists(objFullPath + '.rotateOrder')
+
+        if hasRotateOrder:
             objDict['objData']['rotateOrder'] = mc.getAttr(objFullPath + '.rotateOrder')
         else:
             objDict['objData']['rotateOrder'] = 0
 
         # add object attributes
-        if attrsType == 'all':
+        if schema is not None:
+            # Schemas are shared between instances, locks aren't
+            node = om.MFnDependencyNode(nodeObj)
+            attrList = []
+            for attr in schema['all' if attrsType == 'all' else 'keyable']:
+                plug = self.findApiPlug(node, objFullPath, attr)
+                if plug is not None and not plug.isLocked:
+                    attrList.append(attr)
+        elif attrsType == 'all':
             attrList = mc.listAttr(objFullPath, unlocked=True, scalar=True, multi=True)
         else:  # defaults to 'keyable' if none set
             attrList = mc.listAttr(objFullPath, unlocked=True, keyable=True, visible=True, scalar=True, multi=True)
@@ -236,47 +606,30 @@ class DataWrapper:
             attrList = []
 
         for attrName in attrList:
-            objDict['objAttrs'][attrName] = self.getAttrDict(objFullPath, attrName, startFrame, endFrame, dataType)
+            objDict['objAttrs'][sys.intern(attrName)] = self.getAttrDict(
+                objFullPath, attrName, startFrame, endFrame, dataType,
+                animatedAttrs is None or attrName in animatedAttrs
+            )
 
         return objDict
 
-    def getAttrDict(self, objFullPath, attrName, startFrame, endFrame, dataType):
+    def getAttrDict(self, objFullPath, attrName, startFrame, endFrame, dataType, isAnimated=True):
         # setting attribute data
         objName = objFullPath
 
         attrDict = {'values': {}}
-        keyframeCount = mc.keyframe(objName + '.' + attrName, time=(startFrame, endFrame), q=True, keyframeCount=True)
 
-        if keyframeCount != 0 and dataType == 'anim':
-            # setting attribute anim data
-            attrDict['values']['anim'] = {'animData': {}, 'animKeys': {}}
-            attrDict['values']['anim']['animData']['weightedTangents'] = \
-                mc.keyTangent(objName + '.' + attrName, time=(startFrame, endFrame), q=True, wt=True)[0]
-
-            '''
-            ###	infinity state meaning:
-            0: "constant"
-            1: "linear"
-            2: "constant"
-            3: "cycle"
-            4: "cycleRelative"
-            5: "oscillate"
-            '''
-
-            try:
-                preInfinity, postInfinity = mc.setInfinity(objName, attribute=attrName, query=True, pri=True, poi=True)
-            except:
-                print("# paie.getAttrDict >> Getting infinity values failed. Defaulting to 'constant'")
-                traceback.print_exc()
-                preInfinity, postInfinity = ("constant", "constant")
+        animDict = None
+        if dataType == 'anim' and isAnimated:
+            if self.useApi:
+                animDict = self.getApiAnimDict(objName, attrName, startFrame, endFrame)
 
-            attrDict['values']['anim']['animData']['preInfinity'] = preInfinity
-            attrDict['values']['anim']['animData']['postInfinity'] = postInfinity
+            if animDict is None:
+                animDict = self.getCmdsAnimDict(objName, attrName, startFrame, endFrame)
 
-            # adding attribute keyframes
-            attrDict['values']['anim']['animKeys'] = self.getKeyframeDict(
-                objFullPath, attrName, keyframeCount, startFrame, endFrame
-            )
+        if animDict:
+            # setting attribute anim data
+            attrDict['values']['anim'] = animDict
 
         else:
             # setting attribute pose data
@@ -307,6 +660,171 @@ class DataWrapper:
         return attrDict
 
 
+    def getAnimatedAttrs(self, selList):
+        """
+        Finds the attributes of selList that can hold keys from their connections, instead of querying keys of
+        every attribute: attributes driven by anything (animCurves, anim layers, pairBlends, ...) and attributes
+        feeding a character. Unconnected attributes are static.
+        Connections of the whole selection are read in two listConnections queries. Children of connected
+        compounds are looked up once per node type and attribute.
+        Returns {objFullPath: set of attribute names}. Objects missing from it get every attribute queried
+        """
+        connections = mc.listConnections(
+            selList, source=True, destination=False, plugs=True, connections=True, skipConversionNodes=True
+        ) or []
+        connections += mc.listConnections(
+            selList, source=False, destination=True, plugs=True, connections=True, type='character'
+        ) or []
+
+        typeList = mc.ls(selList, long=True, showType=True) or []
+        nodeTypes = dict(zip(typeList[0::2], typeList[1::2]))
+
+        animatedAttrs = {}
+        for obj in nodeTypes:
+            animatedAttrs[obj] = set()
+
+        childAttrs = {}
+        for obj, attrConnections in self.bucketConnections(connections, list(nodeTypes)).items():
+            attrs = animatedAttrs[obj]
+            for attr, otherPlug in attrConnections:
+                attrs.add(attr)
+
+                # Children of connected compounds (f.x. translate) are driven as well
+                leafAttr = attr.split(".")[-1].split("[")[0]
+                key = (nodeTypes[obj], leafAttr)
+                if key not in childAttrs:
+                    try:
+                        childAttrs[key] = mc.attributeQuery(leafAttr, node=obj, listChildren=True) or []
+                    except RuntimeError:
+                        childAttrs[key] = []
+                attrs.update(childAttrs[key])
+
+        return animatedAttrs
+
+    def getCmdsAnimDict(self, objName, attrName, startFrame, endFrame):
+        """Queries animation of an attribute with maya.cmds. Returns {} when there are no keys in range"""
+        keyframeCount = mc.keyframe(objName + '.' + attrName, time=(startFrame, endFrame), q=True, keyframeCount=True)
+
+        if keyframeCount == 0:
+            return {}
+
+        animDict = {'animData': {}, 'animKeys': {}}
+        animDict['animData']['weightedTangents'] = \
+            mc.keyTangent(objName + '.' + attrName, time=(startFrame, endFrame), q=True, wt=True)[0]
+
+        '''
+        ###	infinity state meaning:
+        0: "constant"
+        1: "linear"
+        2: "constant"
+        3: "cycle"
+        4: "cycleRelative"
+        5: "oscillate"
+        '''
+
+        try:
+            preInfinity, postInfinity = mc.setInfinity(objName, attribute=attrName, query=True, pri=True, poi=True)
+        except:
+            print("# paie.getAttrDict >> Getting infinity values failed. Defaulting to 'constant'")
+            traceback.print_exc()
+            preInfinity, postInfinity = ("constant", "constant")
+
+        animDict['animData']['preInfinity'] = preInfinity
+        animDict['animData']['postInfinity'] = postInfinity
+
+        # adding attribute keyframes
+        animDict['animKeys'] = self.getKeyframeDict(objName, attrName, keyframeCount, startFrame, endFrame)
+
+        return animDict
+
+    def getApiAnimDict(self, objName, attrName, startFrame, endFrame):
+        """
+        Reads keys, tangents and infinity of an attribute straight from its animCurve in one pass.
+        Returns {} when there are no keys in range and None when the attribute isn't driven directly
+        by an animCurve, leaving those to getCmdsAnimDict. That includes character set members, which are
+        keyed on the character, and children of connected compounds
+        """
+        selList = om.MSelectionList()
+        try:
+            selList.add(objName + '.' + attrName)
+            plug = selList.getPlug(0)
+        except (RuntimeError, TypeError):
+            return None
+
+        if not plug.isDestination:
+            for destination in plug.destinations():
+                if destination.node().hasFn(om.MFn.kCharacter):
+                    return None
+            if plug.isChild and plug.parent().isConnected:
+                return None
+            return {}
+
+        curveObj = plug.source().node()
+        if not curveObj.hasFn(om.MFn.kAnimCurve):
+            return None
+
+        curveFn = oma.MFnAnimCurve(curveObj)
+        curveType = curveFn.animCurveType
+        if curveType not in (oma.MFnAnimCurve.kAnimCurveTA, oma.MFnAnimCurve.kAnimCurveTL,
+                             oma.MFnAnimCurve.kAnimCurveTU):
+            return None
+
+        tangentTypes = {}
+        for name, tangentType in self.getApiTangentTypes().items():
+            tangentTypes[tangentType] = name
+
+        infinityTypes = {
+            oma.MFnAnimCurve.kConstant: "constant",
+            oma.MFnAnimCurve.kLinear: "linear",
+            oma.MFnAnimCurve.kCycle: "cycle",
+            oma.MFnAnimCurve.kCycleRelative: "cycleRelative",
+            oma.MFnAnimCurve.kOscillate: "oscillate",
+        }
+
+        timeUnit = om.MTime.uiUnit()
+        angleUnit = om.MAngle.uiUnit()
+        if curveType == oma.MFnAnimCurve.kAnimCurveTA:
+            toUI = om.MAngle.internalToUI
+        elif curveType == oma.MFnAnimCurve.kAnimCurveTL:
+            toUI = om.MDistance.internalToUI
+        else:
+            toUI = float
+
+        animKeys = AnimKeys()
+        for index in range(curveFn.numKeys):
+            frameNr = curveFn.input(index).asUnits(timeUnit)
+            if frameNr < startFrame or frameNr > endFrame:
+                continue
+
+            inTangentType = tangentTypes.get(curveFn.inTangentType(index))
+            outTangentType = tangentTypes.get(curveFn.outTangentType(index))
+            if inTangentType is None or outTangentType is None:
+                return None
+
+            inAngle, inWeight = curveFn.getTangentAngleWeight(index, True)
+            outAngle, outWeight = curveFn.getTangentAngleWeight(index, False)
+
+            animKeys.appendKey(
+                frameNr - startFrame,  # Place first key at frame 1
+                toUI(curveFn.value(index)),
+                inAngle.asUnits(angleUnit), outAngle.asUnits(angleUnit), inWeight, outWeight,
+                inTangentType, outTangentType,
+                curveFn.tangentsLocked(index), curveFn.weightsLocked(index), 0,
+            )
+
+        if not len(animKeys):
+            return {}
+
+        preInfinity = infinityTypes.get(curveFn.preInfinityType, "constant")
+        postInfinity = infinityTypes.get(curveFn.postInfinityType, "constant")
+
+        return {
+            'animData': {
+                'weightedTangents': curveFn.isWeighted, 'preInfinity': preInfinity, 'postInfinity': postInfinity,
+            },
+            'animKeys': animKeys,
+        }
+
     def getKeyframeDict(self, objFullPath, attrName, keyframeCount, startFrame, endFrame):
         attributes = mc.keyTangent(
             objFullPath + '.' + attrName, time=(startFrame, endFrame), q=True, inAngle=True, outAngle=True, inWeight=True,
@@ -323,24 +841,21 @@ class DataWrapper:
         # if breakdown != None:
         #	breakdownState = 1
 
-        keyDict = {}
-        iter = range(0, keyframeCount)
-        for i in iter:
-            keyDict[i] = {
-                'time': frameValues[((i + 1) * 2) - 2] - startFrame,  # Place first key at frame 1
-                'value': frameValues[((i + 1) * 2) - 1],
-                'inAngle': attributes[i * 8],
-                'outAngle': attributes[i * 8 + 1],
-                'inWeight': attributes[i * 8 + 2],
-                'outWeight': attributes[i * 8 + 3],
-                'inTangentType': attributes[i * 8 + 4],
-                'outTangentType': attributes[i * 8 + 5],
-                'lock': attributes[i * 8 + 6],
-                'weightLock': attributes[i * 8 + 7],
-                'breakedown': breakdownState,
-            }
+        return AnimKeys.fromLists(
+            # Place first key at frame 1
+            time=[frameNr - startFrame for frameNr in frameValues[0:keyframeCount * 2:2]],
+            value=frameValues[1:keyframeCount * 2:2],
+            inAngle=attributes[0::8],
+            outAngle=attributes[1::8],
+            inWeight=attributes[2::8],
+            outWeight=attributes[3::8],
+            inTangentType=attributes[4::8],
+            outTangentType=attributes[5::8],
+            lock=attributes[6::8],
+            weightLock=attributes[7::8],
+            breakedown=[breakdownState] * keyframeCount,
+        )
 
-        return keyDict
     def convertSelToDict(self, selList):
         selDict = {}
 
@@ -350,47 +865,721 @@ class DataWrapper:
 
         return selDict
 
-    def mapImportToSelection(self, selection):
-        objIdDict = self.dataObj.getObjIdDict()
-        outputDict = {}
-        for j in selection:
-            sel = j.split("|")[-1]
-            sel = sel.split(":")[-1]
-            iMatch = None
-            for i in objIdDict:
-
-                importName = objIdDict[i].split("|")[-1]
-
-                if importName == sel:
-                    outputDict[i] = j
-                    iMatch = i
+    def mapImportToSelection(self, selection, selIndex=None):
+        if selIndex is None:
+            selIndex = SelectionIndex(selection)
 
-            if iMatch is not None:
-                objIdDict.pop(iMatch)
+        outputDict = selIndex.mapToFile(self.dataObj.getObjIdDict())
 
         if len(outputDict.keys()) == 0:
             raise Exception("# mapImportToSelection >> No import objects matched selection")
 
         return outputDict
 
-    def writeToScene(self, selection, selectOrder, namespace, animOffset):
+    def mapImportToTargets(self, selection, selIndex=None):
+        """Like mapImportToSelection, once per namespace in the selection. Returns a list of (objID, target)"""
+        if selIndex is None:
+            selIndex = SelectionIndex(selection)
+
+        targets = selIndex.mapToFileTargets(self.dataObj.getObjIdDict())
+
+        if not targets:
+            raise Exception("# mapImportToTargets >> No import objects matched selection")
+
+        return targets
+
+    def loadApiPlugin(self):
+        """Loads this file as a plugin to get PaieApiEdit registered. Returns 0 if that isn't possible"""
+        pluginPath = os.path.splitext(os.path.abspath(__file__))[0] + ".py"
+
+        try:
+            if not mc.pluginInfo(pluginPath, query=True, loaded=True):
+                mc.loadPlugin(pluginPath, quiet=True)
+        except RuntimeError:
+            print("# DataWrapper.loadApiPlugin >> Could not load " + pluginPath + " as a plugin. Using maya.cmds")
+            traceback.print_exc()
+            return 0
+
+        return 1
+
+    def runApiEdit(self, edit):
+        """Runs edit(dgMod, animChange) as a single undoable PaieApiEdit command"""
+        PaieApiEdit.pendingEdit = edit
+        try:
+            getattr(mc, PaieApiEdit.commandName)(__name__)
+        finally:
+            PaieApiEdit.pendingEdit = None
+
+    def getApiPlug(self, plugName):
+        """
+        Returns the MPlug of plugName if keys can be written straight onto its animCurve.
+        Returns None for anything setKeyframe has to resolve (anim layers, characters, constraints,
+        locked plugs, time valued curves)
+        """
+        selList = om.MSelectionList()
+        try:
+            selList.add(plugName)
+            plug = selList.getPlug(0)
+        except (RuntimeError, TypeError):
+            return None
+
+        if plug.isLocked:
+            return None
+
+        if plug.isDestination:
+            if not plug.source().node().hasFn(om.MFn.kAnimCurve):
+                return None
+
+        for destination in plug.destinations():
+            if destination.node().hasFn(om.MFn.kCharacter):
+                return None
+
+        if oma.MFnAnimCurve().timedAnimCurveTypeForPlug(plug) == oma.MFnAnimCurve.kAnimCurveTT:
+            return None
+
+        return plug
+
+    def getImportPlan(self, targets, startTime, stopTime, progress=None):
+        """
+        Gathers the target state of targets (list of (objID, target object)) in one pass, through OpenMaya
+        unless useApi is off. OpenMaya resolves all objects through a single selection list and their plugs
+        through findPlug. maya.cmds lists attributes and locks once per object. The driven state of all pose
+        plugs is read in one go by getDrivenPlugs. Returns an ImportPlan
+        """
+        plan = ImportPlan()
+
+        nodes = {}
+        if self.useApi:
+            selList = om.MSelectionList()
+            for objID, obj in targets:
+                if obj in nodes:
+                    continue
+                try:
+                    selList.add(obj)
+                except (RuntimeError, TypeError):
+                    continue
+                nodes[obj] = om.MFnDependencyNode(selList.getDependNode(selList.length() - 1))
+
+        candidates = []
+        for objID, obj in targets:
+            if progress is not None:
+                progress.printStatus()
+
+            if self.useApi:
+                node = nodes.get(obj)
+                objExists = node is not None
+            else:
+                objExists = mc.objExists(obj)
+
+            if not objExists:
+                plan.nonExistingObjs.append(obj)  # Saved for future reference
+                continue
+
+            plan.targets.append((objID, obj))
+
+            schema = None
+            if schemaCaching and self.useApi:
+                schema = SchemaCache.get(obj, node.object())[0]
+
+            if not self.useApi:
+                existingAttrs = set(mc.listAttr(obj, scalar=True, multi=True) or [])
+                lockedAttrs = set(mc.listAttr(obj, locked=True, scalar=True, multi=True) or [])
+
+            # check rotate order
+            if schema is not None:
+                hasRotateOrder = schema['hasRotateOrder']
+            elif self.useApi:
+                hasRotateOrder = node.hasAttribute('rotateOrder')
+            else:
+                hasRotateOrder = 'rotateOrder' in existingAttrs
+
+            currRoo = None
+            if hasRotateOrder:
+                if self.useApi:
+                    currRoo = node.findPlug('rotateOrder', False).asInt()
+                else:
+                    currRoo = mc.getAttr(obj + '.rotateOrder')
+
+            if currRoo is not None:
+                importRoo = self.dataObj.getObjDataVal(objID, 'rotateOrder')
+                if currRoo != importRoo:
+                    plan.rooMismatches[obj] = {"currentRoo": currRoo, "sourceRoo": importRoo}
+
+            objAttrs = self.dataObj.getObjAttrDict(objID)
+            for attr in objAttrs:
+                plugName = obj + '.' + attr
+                isPose = 'anim' not in objAttrs[attr]['values']
+
+                # Existence and locks are read per target, as instances sharing a schema can differ in both
+                if self.useApi:
+                    plug = self.findApiPlug(node, obj, attr)
+                    if plug is None:
+                        plan.missingAttrs.append(plugName)
+                        continue
+                    plan.apiPlugs[plugName] = plug
+                    isLocked = plug.isLocked
+                elif attr in existingAttrs:
+                    isLocked = attr in lockedAttrs
+                else:
+                    plan.missingAttrs.append(plugName)
+                    continue
+
+                if isLocked:
+                    plan.lockedPlugs.append(plugName)
+                else:
+                    candidates.append((objID, obj, attr, isPose))
+
+        drivenPlugs = self.getDrivenPlugs(
+            [obj + '.' + attr for objID, obj, attr, isPose in candidates if isPose], plan
+        )
+        for objID, obj, attr, isPose in candidates:
+            if obj + '.' + attr in drivenPlugs:
+                plan.connectedPlugs.append(obj + '.' + attr)
+            else:
+                plan.plugs.append((objID, obj, attr))
+
+        # Existing keys of all targets in a single query
+        if plan.targets:
+            plan.keyCount = mc.keyframe(plan.listObjs(), time=(startTime, stopTime), q=True, keyframeCount=True) or 0
+            if plan.keyCount and self.useApi:
+                plan.keyedCurves = mc.keyframe(plan.listObjs(), time=(startTime, stopTime), q=True, name=True) or []
+
+        return plan
+
+    def findApiPlug(self, node, obj, attr):
+        """MPlug of obj.attr through its MFnDependencyNode, or None if it doesn't exist"""
+        try:
+            if '[' not in attr and '.' not in attr:
+                return node.findPlug(attr, False)
+
+            # findPlug doesn't take indices or compound paths, f.x. weight[0]
+            selList = om.MSelectionList()
+            selList.add(obj + '.' + attr)
+            return selList.getPlug(0)
+        except (RuntimeError, TypeError):
+            return None
+
+    def getDrivenPlugs(self, plugNames, plan):
+        """
+        Returns the set of plugNames getting their value from a connection other than an animCurve.
+        Plugs in plan.apiPlugs are checked on the MPlug, the others with one listConnections and one ls query
+        """
+        drivenPlugs = set()
+        cmdsPlugs = []
+        for plugName in plugNames:
+            plug = plan.apiPlugs.get(plugName)
+            if plug is None:
+                cmdsPlugs.append(plugName)
+            elif plug.isDestination and not plug.source().node().hasFn(om.MFn.kAnimCurve):
+                drivenPlugs.add(plugName)
+
+        if not cmdsPlugs:
+            return drivenPlugs
+
+        connections = mc.listConnections(
+            cmdsPlugs, source=True, destination=False, plugs=True, connections=True, skipConversionNodes=True
+        ) or []
+        if not connections:
+            return drivenPlugs
+
+        curves = set(mc.ls([plugName.split(".")[0] for plugName in connections[1::2]], type='animCurve') or [])
+        objs = list(dict.fromkeys([plugName.split(".", 1)[0] for plugName in cmdsPlugs]))
+        for obj, attrConnections in self.bucketConnections(connections, objs).items():
+            for attr, sourcePlug in attrConnections:
+                if sourcePlug.split(".")[0] not in curves:
+                    drivenPlugs.add(obj + '.' + attr)
+
+        return drivenPlugs
+
+    def bucketConnections(self, connections, paths):
+        """
+        Groups the flat [ownPlug, otherPlug, ...] list of listConnections(connections=True) by node.
+        Maya names nodes by their shortest unique path, which is matched back onto paths (full paths).
+        Returns {path: [(attr, otherPlug)]}
+        """
+        pathsByLeaf = {}
+        for path in paths:
+            pathsByLeaf.setdefault(path.split("|")[-1], []).append(path)
+
+        buckets = {}
+        matchedPaths = {}
+        for ownPlug, otherPlug in zip(connections[0::2], connections[1::2]):
+            nodeName, attr = ownPlug.split(".", 1)
+            if nodeName not in matchedPaths:
+                matchedPaths[nodeName] = None
+                for path in pathsByLeaf.get(nodeName.split("|")[-1], []):
+                    if path == nodeName or path.endswith("|" + nodeName):
+                        matchedPaths[nodeName] = path
+                        break
+
+            if matchedPaths[nodeName] is not None:
+                buckets.setdefault(matchedPaths[nodeName], []).append((attr, otherPlug))
+
+        return buckets
+
+    def compileImport(self, plan, animOffset, progress=None):
+        """
+        Flattens the file data of plan.plugs in a single pass over the container, so writing doesn't look
+        anything up in it anymore. Fills
+            plan.curves:        a curveData dict per animated attribute holding objID, obj, attr, plugName,
+                                weightedTangents, preInfinity, postInfinity and per key lists of time (offset by
+                                animOffset), value, inAngle, outAngle, inWeight, outWeight, inTangentType,
+                                outTangentType, lock and weightLock
+            plan.poseValues:    (plugName, value) per static attribute
+        """
+        plan.curves = []
+        plan.poseValues = []
+
+        lastTarget = None
+        for objID, obj, attr in plan.plugs:
+            if (objID, obj) != lastTarget:
+                # Progress printing
+                if progress is not None:
+                    progress.printStatus()
+                objAttrs = self.dataObj.getObjAttrDict(objID)
+                lastTarget = (objID, obj)
+
+            values = objAttrs[attr]['values']
+            plugName = obj + '.' + attr
+
+            if 'anim' not in values:
+                plan.poseValues.append((plugName, values['pose']['value']))
+                continue
+
+            animData = values['anim']['animData']
+            animKeys = values['anim']['animKeys']
+            plan.curves.append({
+                'objID': objID,
+                'obj': obj,
+                'attr': attr,
+                'plugName': plugName,
+                'weightedTangents': int(animData['weightedTangents']),
+                'preInfinity': animData['preInfinity'],
+                'postInfinity': animData['postInfinity'],
+                'time': [frameNr + animOffset for frameNr in animKeys.time],
+                'value': animKeys.value.tolist(),
+                'inAngle': animKeys.inAngle.tolist(),
+                'outAngle': animKeys.outAngle.tolist(),
+                'inWeight': animKeys.inWeight.tolist(),
+                'outWeight': animKeys.outWeight.tolist(),
+                'inTangentType': animKeys.getTangentTypes('inTangentType'),
+                'outTangentType': animKeys.getTangentTypes('outTangentType'),
+                'lock': animKeys.lock.tolist(),
+                'weightLock': animKeys.weightLock.tolist(),
+            })
+
+    def getApiTangentTypes(self):
+        """Maps keyTangent tangent type names to MFnAnimCurve tangent types"""
+        apiTangentTypes = {
+            'global': oma.MFnAnimCurve.kTangentGlobal,
+            'fixed': oma.MFnAnimCurve.kTangentFixed,
+            'linear': oma.MFnAnimCurve.kTangentLinear,
+            'flat': oma.MFnAnimCurve.kTangentFlat,
+            'spline': oma.MFnAnimCurve.kTangentSmooth,
+            'step': oma.MFnAnimCurve.kTangentStep,
+            'slow': oma.MFnAnimCurve.kTangentSlow,
+            'fast': oma.MFnAnimCurve.kTangentFast,
+            'clamped': oma.MFnAnimCurve.kTangentClamped,
+            'plateau': oma.MFnAnimCurve.kTangentPlateau,
+            'stepnext': oma.MFnAnimCurve.kTangentStepNext,
+            'auto': oma.MFnAnimCurve.kTangentAuto,
+        }
+
+        # Only available in newer versions of Maya
+        for name, apiName in (('autoease', 'kTangentAutoEase'), ('automix', 'kTangentAutoMix'),
+                              ('autocustom', 'kTangentAutoCustom')):
+            if hasattr(oma.MFnAnimCurve, apiName):
+                apiTangentTypes[name] = getattr(oma.MFnAnimCurve, apiName)
+
+        return apiTangentTypes
+
+    def writeApiCurves(self, apiCurves, dgMod, animChange, progress=None):
+        """
+        apiCurves:  list of (MPlug, curveData) with curveData as compiled by compileImport
+        Creates missing animCurves through dgMod, then adds all keys of each curve in one call
+        and restores weighting, tangent angles, weights, types and locks in a single pass per curve
+        """
+        curveFns = []
+        for plug, curveData in apiCurves:
+            curveFn = oma.MFnAnimCurve()
+            if plug.isDestination:
+                curveFn.setObject(plug.source().node())
+            else:
+                curveFn.create(plug, None, dgMod)
+            curveFns.append(curveFn)
+
+        dgMod.doIt()
+
+        timeUnit = om.MTime.uiUnit()
+        angleUnit = om.MAngle.uiUnit()
+        tangentTypes = self.getApiTangentTypes()
+        infinityTypes = {
+            'constant': oma.MFnAnimCurve.kConstant,
+            'linear': oma.MFnAnimCurve.kLinear,
+            'cycle': oma.MFnAnimCurve.kCycle,
+            'cycleRelative': oma.MFnAnimCurve.kCycleRelative,
+            'oscillate': oma.MFnAnimCurve.kOscillate,
+        }
+
+        for curveFn, (plug, curveData) in zip(curveFns, apiCurves):
+            if progress is not None:
+                progress.printStatus()
+
+            values = curveData['value']
+            curveType = curveFn.animCurveType
+            if curveType in (oma.MFnAnimCurve.kAnimCurveTA, oma.MFnAnimCurve.kAnimCurveUA):
+                values = [om.MAngle.uiToInternal(val) for val in values]
+            elif curveType in (oma.MFnAnimCurve.kAnimCurveTL, oma.MFnAnimCurve.kAnimCurveUL):
+                values = [om.MDistance.uiToInternal(val) for val in values]
+
+            isNewCurve = curveFn.numKeys == 0
+            times = [om.MTime(frameNr, timeUnit) for frameNr in curveData['time']]
+            curveFn.addKeys(
+                om.MTimeArray(times), om.MDoubleArray(values),
+                oma.MFnAnimCurve.kTangentGlobal, oma.MFnAnimCurve.kTangentGlobal, True, animChange
+            )
+
+            # Set Tangents
+            weighted = curveData['weightedTangents']
+            curveFn.setIsWeighted(bool(weighted), animChange)
+
+            for i in range(len(times)):
+                index = i if isNewCurve else curveFn.find(times[i])
+
+                # Unlocked while setting angles so in and out don't overwrite each other
+                curveFn.setTangentsLocked(index, False, animChange)
+                curveFn.setWeightsLocked(index, False, animChange)
+                curveFn.setTangent(
+                    index, om.MAngle(curveData['inAngle'][i], angleUnit), curveData['inWeight'][i], True, animChange
+                )
+                curveFn.setTangent(
+                    index, om.MAngle(curveData['outAngle'][i], angleUnit), curveData['outWeight'][i], False,
+                    animChange
+                )
+                curveFn.setInTangentType(index, tangentTypes[curveData['inTangentType'][i]], animChange)
+                curveFn.setOutTangentType(index, tangentTypes[curveData['outTangentType'][i]], animChange)
+                curveFn.setTangentsLocked(index, bool(curveData['lock'][i]), animChange)
+                if weighted:
+                    curveFn.setWeightsLocked(index, bool(curveData['weightLock'][i]), animChange)
+
+            ###	Setting infinity
+            if curveData['preInfinity'] != "constant":
+                curveFn.setPreInfinityType(infinityTypes[curveData['preInfinity']], animChange)
+            if curveData['postInfinity'] != "constant":
+                curveFn.setPostInfinityType(infinityTypes[curveData['postInfinity']], animChange)
+
+    def setKeysCmds(self, curveData):
+        """Fallback writing one setKeyframe per key"""
+        obj = curveData['obj']
+        attr = curveData['attr']
+        for frameNr, value in zip(curveData['time'], curveData['value']):
+
+            ### maya 2010 bugfix - can't set rotation values with setKeyframe when on animLayers
+            # if attr in ("rotateX", "rotateY", "rotateZ"):
+            # mc.currentTime( frameNr )
+            # try:
+            # mc.setAttr(obj + "." + attr, value)
+            # mc.setKeyframe(obj , time =  frameNr  , attribute = str(attr), breakdown=False, hierarchy='none',
+            # controlPoints=False, shape=False )
+            # except:
+            # pass
+
+            # else:
+            # mc.setKeyframe(obj , time =  frameNr  , attribute = str(attr)  , value =  value, breakdown=False,
+            # hierarchy='none', controlPoints=False, shape=False )
+
+            mc.setKeyframe(
+                obj, time=frameNr, attribute=str(attr), value=float(value), breakdown=False,
+                hierarchy='none', controlPoints=False, shape=False
+            )
+
+    def setTangentsCmds(self, curveData):
+        """Fallback editing tangents with keyTangent per key"""
+        plugName = curveData['plugName']
+        weighted = curveData['weightedTangents']
+        mc.keyTangent(plugName, edit=True, wt=weighted)
+
+        for i in range(len(curveData['time'])):
+
+            try:
+                frameNr = curveData['time'][i]
+
+                mc.keyTangent(
+                    plugName, time=(frameNr, frameNr), edit=True, inAngle=curveData['inAngle'][i],
+                    outAngle=curveData['outAngle'][i], inWeight=curveData['inWeight'][i],
+                    outWeight=curveData['outWeight'][i]
+                )
+                mc.keyTangent(
+                    plugName, time=(frameNr, frameNr), edit=True, inTangentType=curveData['inTangentType'][i],
+                    outTangentType=curveData['outTangentType'][i]
+                )
+                mc.keyTangent(plugName, time=(frameNr, frameNr), edit=True, lock=curveData['lock'][i])
+                if weighted:
+                    mc.keyTangent(plugName, time=(frameNr, frameNr), edit=True, weightLock=curveData['weightLock'][i])
+            except Exception as e:
+                print(e)
+                print("# paie.writeToScene caught this kind of error while applying keyframes:")
+                raise
+
+    def getApiCurves(self, curves):
+        """
+        curves:     list of curveData as compiled by compileImport
+        Returns (apiCurves, cmdsCurves): (MPlug, curveData) of the curves writeApiCurves can write straight
+        through OpenMaya and the curveData that have to fall back to setKeyframe/keyTangent per key
+        """
+        cmdsCurves = []
+        apiCurves = []
+        tangentTypes = self.getApiTangentTypes()
+        for curveData in curves:
+            plug = self.getApiPlug(curveData['plugName'])
+            if plug is None:
+                cmdsCurves.append(curveData)
+                continue
+
+            for tangentType in set(curveData['inTangentType'] + curveData['outTangentType']):
+                if tangentType not in tangentTypes:
+                    cmdsCurves.append(curveData)
+                    break
+            else:
+                apiCurves.append((plug, curveData))
+
+        return apiCurves, cmdsCurves
+
+    def writeCurvesCmds(self, curves, progress=None):
+        for curveData in curves:
+            if progress is not None:
+                progress.printStatus()
+
+            self.setKeysCmds(curveData)
+            self.setTangentsCmds(curveData)
+
+            ###	Setting infinity
+            if curveData['preInfinity'] != "constant":
+                mc.setInfinity(curveData['obj'], attribute=curveData['attr'], pri=curveData['preInfinity'])
+
+            if curveData['postInfinity'] != "constant":
+                mc.setInfinity(curveData['obj'], attribute=curveData['attr'], poi=curveData['postInfinity'])
+
+    def getInstances(self, curves, plan):
+        """
+        Splits curves into the curves to write and the instances to take from them: of all targets of an objID
+        and attribute without an incoming connection, the first one is written key by key and the others get
+        the curve of the first one through instanceCurves. Targets that already hold a curve are always written.
+        Returns (curves, instances) with instances as a list of (source plugName, curveData)
+        """
+        writeCurves = []
+        instances = []
+        sourcePlugs = {}
+        for curveData in curves:
+            plug = plan.apiPlugs.get(curveData['plugName'])
+            if plug is not None:
+                isConnected = plug.isDestination
+            else:
+                isConnected = bool(mc.listConnections(curveData['plugName'], source=True, destination=False))
+
+            if isConnected:
+                writeCurves.append(curveData)
+                continue
+
+            key = (curveData['objID'], curveData['attr'])
+            if key in sourcePlugs:
+                instances.append((sourcePlugs[key], curveData))
+            else:
+                sourcePlugs[key] = curveData['plugName']
+                writeCurves.append(curveData)
+
+        return writeCurves, instances
+
+    def instanceCurves(self, instances, instanceMode, progress=None):
+        """
+        instances:      list of (source plugName, curveData) from getInstances, after the sources were written
+        instanceMode:   "shared" connects the animCurve of the source to the target, so all targets play the same
+                        live curve. "duplicate" connects a copy of it instead
+        Targets whose source didn't end up with a plain animCurve (f.x. on animation layers) are written normally
+        """
+        sourceCurves = {}
+        for sourcePlugName, curveData in instances:
+            if progress is not None:
+                progress.printStatus()
+
+            if sourcePlugName not in sourceCurves:
+                sourceCurves[sourcePlugName] = mc.listConnections(
+                    sourcePlugName, source=True, destination=False, type='animCurve'
+                )
+
+            if not sourceCurves[sourcePlugName]:
+                self.writeCurvesCmds([curveData])
+                continue
+
+            curve = sourceCurves[sourcePlugName][0]
+            if instanceMode == "duplicate":
+                curve = mc.duplicate(curve)[0]
+            mc.connectAttr(curve + '.output', curveData['plugName'], force=True)
+
+    def cutApiKeys(self, curveNames, startTime, stopTime, dgMod, animChange):
+        """
+        Removes the keys of curveNames in startTime-stopTime like cutKey -clear. Curves left without keys
+        are deleted through dgMod
+        """
+        timeUnit = om.MTime.uiUnit()
+        for curveName in curveNames:
+            selList = om.MSelectionList()
+            selList.add(curveName)
+            curveObj = selList.getDependNode(0)
+            curveFn = oma.MFnAnimCurve(curveObj)
+
+            cutIndexes = []
+            for index in range(curveFn.numKeys):
+                frameNr = curveFn.input(index).asUnits(timeUnit)
+                if startTime <= frameNr <= stopTime:
+                    cutIndexes.append(index)
+
+            if len(cutIndexes) == curveFn.numKeys:
+                dgMod.deleteNode(curveObj)
+            else:
+                for index in reversed(cutIndexes):
+                    curveFn.remove(index, animChange)
+
+        dgMod.doIt()
+
+    def setApiRotateOrder(self, rooMismatchDict, dgMod):
+        for key in rooMismatchDict:
+            print("### " + key.split("|")[-1] + '.rotateOrder -> ' + str(rooMismatchDict[key]["sourceRoo"]))
+            selList = om.MSelectionList()
+            selList.add(key + '.rotateOrder')
+            plug = selList.getPlug(0)
+            if plug.isLocked:
+                print("### Failed to set Rotation Order on object...It's probably locked")
+            else:
+                dgMod.newPlugValueInt(plug, rooMismatchDict[key]["sourceRoo"])
+
+        dgMod.doIt()
+
+    def setRotateOrderCmds(self, rooMismatchDict):
+        for key in rooMismatchDict:
+            print("### " + key.split("|")[-1] + '.rotateOrder -> ' + str(rooMismatchDict[key]["sourceRoo"]))
+            try:
+                mc.setAttr(key + '.rotateOrder', rooMismatchDict[key]["sourceRoo"])
+            except Exception as e:
+                print(e)
+                print("### Failed to set Rotation Order on object...It's probably locked")
+
+    def getApiPoseValue(self, plug, value):
+        """
+        Returns (current value, setter) of a plug, both in ui units, where setter(dgMod, value) queues
+        the new value on dgMod. Returns None for attribute types that are left to setAttr
+        """
+        attrObj = plug.attribute()
+
+        if attrObj.hasFn(om.MFn.kUnitAttribute):
+            unitType = om.MFnUnitAttribute(attrObj).unitType()
+            if unitType == om.MFnUnitAttribute.kAngle:
+                uiUnit = om.MAngle.uiUnit()
+                return plug.asMAngle().asUnits(uiUnit), lambda dgMod, value: dgMod.newPlugValueMAngle(
+                    plug, om.MAngle(value, uiUnit))
+            if unitType == om.MFnUnitAttribute.kDistance:
+                uiUnit = om.MDistance.uiUnit()
+                return plug.asMDistance().asUnits(uiUnit), lambda dgMod, value: dgMod.newPlugValueMDistance(
+                    plug, om.MDistance(value, uiUnit))
+            if unitType == om.MFnUnitAttribute.kTime:
+                uiUnit = om.MTime.uiUnit()
+                return plug.asMTime().asUnits(uiUnit), lambda dgMod, value: dgMod.newPlugValueMTime(
+                    plug, om.MTime(value, uiUnit))
+            return None
+
+        if attrObj.hasFn(om.MFn.kEnumAttribute):
+            return plug.asInt(), lambda dgMod, value: dgMod.newPlugValueInt(plug, int(value))
+
+        if attrObj.hasFn(om.MFn.kNumericAttribute):
+            numericType = om.MFnNumericAttribute(attrObj).numericType()
+            if numericType == om.MFnNumericData.kBoolean:
+                return plug.asBool(), lambda dgMod, value: dgMod.newPlugValueBool(plug, bool(value))
+            if numericType in (om.MFnNumericData.kByte, om.MFnNumericData.kChar, om.MFnNumericData.kShort,
+                               om.MFnNumericData.kInt, om.MFnNumericData.kLong):
+                return plug.asInt(), lambda dgMod, value: dgMod.newPlugValueInt(plug, int(value))
+            if numericType in (om.MFnNumericData.kFloat, om.MFnNumericData.kDouble):
+                return plug.asDouble(), lambda dgMod, value: dgMod.newPlugValueDouble(plug, value)
+
+        return None
+
+    def writeApiPose(self, apiValues, dgMod):
+        """apiValues: list of (setter, value) from getApiPoseValue"""
+        for setter, value in apiValues:
+            setter(dgMod, value)
+
+        dgMod.doIt()
+
+    def getApiPose(self, poseValues, plan):
+        """
+        poseValues: list of (plugName, value) as compiled by compileImport
+        Returns (apiValues, cmdsValues): setters for the changed values writeApiPose can queue on a
+        DG modifier, and the (plugName, value) that have to fall back to getAttr/setAttr
+        """
+        cmdsValues = []
+        apiValues = []
+        for plugName, importValue in poseValues:
+            plug = plan.apiPlugs.get(plugName)
+
+            poseValue = None
+            if plug is not None:
+                poseValue = self.getApiPoseValue(plug, importValue)
+
+            if poseValue is None:
+                cmdsValues.append((plugName, importValue))
+            elif poseValue[0] != importValue:
+                apiValues.append((poseValue[1], importValue))
+
+        return apiValues, cmdsValues
+
+    def writePoseCmds(self, poseValues, progress=None):
+        for plugName, importValue in poseValues:
+            if progress is not None:
+                progress.printStatus()
+
+            # set attribute value with setAttr if it is different than current value
+            currentVal = mc.getAttr(plugName)
+
+            if currentVal != importValue:
+                try:
+                    mc.setAttr(plugName, importValue)
+                except:
+                    print("# writeToScene >> " + plugName + " cannot be modified. Skipping...")
+
+    def writeToScene(
+            self, selection, selectOrder, namespace, animOffset, selIndex=None, multiTarget=False, instanceMode=None
+    ):
+        """
+        multiTarget:    write the clip onto every namespace in selection, in one pass with a single
+                        pre-flight check and confirmation
+        instanceMode:   None, "shared" or "duplicate". Builds each animCurve once and hands it on to the other
+                        targets of the same object and attribute, see getInstances and instanceCurves
+        """
         if debugger == 2:
-            print("# writeToScene start: ".ljust(30), time.clock())
+            print("# writeToScene start: ".ljust(30), time.perf_counter())
 
         self.dataObj.setDefaultNamespace(namespace)
 
+        if multiTarget and selIndex is None:
+            selIndex = SelectionIndex(selection)
+
         if selectOrder == 1:
-            # for convenience, convert selection to a dictionary when selectOrder is set
-            # so that it matches the return value of compareSelection()
-            mutualObjs = self.convertSelToDict(selection)
+            # for convenience, convert selection to (objID, target) pairs when selectOrder is set
+            # so that it matches the return value of mapImportToTargets()
+            if multiTarget:
+                targets = selIndex.mapSelectionOrderTargets()
+            else:
+                targets = list(self.convertSelToDict(selection).items())
         else:
             if debugger == 2:
-                print("# CompareSelection start: ".ljust(30), time.clock())
+                print("# CompareSelection start: ".ljust(30), time.perf_counter())
 
-            mutualObjs = self.mapImportToSelection(selection)
+            if multiTarget:
+                targets = self.mapImportToTargets(selection, selIndex)
+            else:
+                targets = list(self.mapImportToSelection(selection, selIndex).items())
 
             if debugger == 2:
-                print("# CompareSelection End: ".ljust(30), time.clock())
+                print("# CompareSelection End: ".ljust(30), time.perf_counter())
 
         curFps = self.getFramerate()
         srcFps = self.dataObj.getHeaderAttr("framerate")
@@ -404,7 +1593,8 @@ class DataWrapper:
                               curFps +
                               " fps"
                       ),
-                userInput = mc.confirmDialog(
+                userInput = askUser(
+                    'framerateMismatch',
                     title="Framerate doesn't match",
                     message=msg,
                     ma="left",
@@ -418,15 +1608,10 @@ class DataWrapper:
                     raise KeyboardInterrupt("# writeToScene >> Program terminated by user")
 
         # Clear keys in frameRange
-        nonExistingObjs = []
         proceed = 0
-        isKey = 0
-
-        objList = []
-        existObjIdIter = []
 
         if debugger == 2:
-            print("# Check for existin keys: ".ljust(30), time.clock())
+            print("# Check for existin keys: ".ljust(30), time.perf_counter())
 
         startTime = animOffset
         stopTime = animOffset + self.dataObj.getHeaderAttr('clipLength') - 1
@@ -437,187 +1622,1065 @@ class DataWrapper:
         if int(stopTime) == stopTime:
             stopTime = int(stopTime)
 
-        # Checks for existing keys and nonexisting objects
-        for i in mutualObjs:
-            try:
-                if mc.keyframe(mutualObjs[i], time=(startTime, stopTime), q=True, keyframeCount=True):
-                    isKey = 1
+        # Checks for existing keys, nonexisting objects, rotation order, missing and locked attributes
+        progress = ProgressHandler(len(targets), "Importing Data", "query")
+        try:
+            plan = self.getImportPlan(targets, startTime, stopTime, progress)
+        finally:
+            progress.finish()
+        plan.printReport()
+
+        cutKeys = 0
+        if self.dataObj.getHeaderAttr('filetype') == 'anim':
+            if plan.keyCount:
+                proceed = askUser(
+                    'overwriteKeys',
+                    title="Keys exist",
+                    message=("Keys already exist in framerange: " + str(startTime) + '-' + str(stopTime) + '\nOverrwrite?'),
+                    button=["Yes", "No"], defaultButton="Yes", cancelButton="No", dismissString="No"
+                )
+                if proceed == 'No':
+                    raise KeyboardInterrupt("# writeToScene >> Procedure cancelled by user")
+
+                # existing animation on objs with importAnim data is removed along with the rest of the edits
+                cutKeys = 1
+
+        # Starting to write data
+        skippedAttrs = []
+
+        if debugger == 2:
+            print("# write keys start: ".ljust(30), time.perf_counter())
+
+        # Dismatching rotation order on objects before writing
+        rooMismatchDict = plan.rooMismatches
+        setRoo = 0
+
+        if len(rooMismatchDict.values()):
+            proceed = "Yes"
+            print("\n### Target objects with mismatching rotation order:")
+            for key in rooMismatchDict:
+                print(
+                    key.split("|")[-1] + ": source roo: " + str(rooMismatchDict[key]["sourceRoo"])
+                    + ", target roo: " + str(rooMismatchDict[key]["currentRoo"])
+                )
+
+            proceed = askUser(
+                'matchRotateOrder',
+                title="Keys exist",
+                message=(
+                    "One or more objects rotation order dismatches import values. \nMatch target rotationOrder to source?"),
+                button=["Yes", "No"],
+                defaultButton="Yes",
+                cancelButton="No",
+                dismissString="No"
+            )
+
+            if proceed == "Yes":
+                setRoo = 1
+
+            elif proceed == "No":
+                print("### Not touching rotation order...")
+                # raise KeyboardInterrupt, "# writeToScene >> Procedure cancelled by user"
+
+        # Initializing progress handler
+        progress = ProgressHandler(len(plan.targets), "Importing Data", "collect")
+        progress.printStatus()
+        try:
+            # Keys and values are written in bulk from the compiled plan
+            self.compileImport(plan, animOffset, progress)
+            curves = plan.curves
+            poseValues = plan.poseValues
+
+            instances = []
+            if instanceMode:
+                curves, instances = self.getInstances(curves, plan)
+
+            for plugName in plan.lockedPlugs + plan.connectedPlugs:
+                print("# writeToScene >> " + plugName + " cannot be modified. Skipping...")
+
+            if self.useApi and self.loadApiPlugin():
+                # Key clearing, rotation order, values, keys, tangents and infinity as one undoable PaieApiEdit.
+                # Only what OpenMaya can't write safely is left to maya.cmds afterwards
+                apiValues, poseValues = self.getApiPose(poseValues, plan)
+                apiCurves, curves = self.getApiCurves(curves)
+                keyedCurves = plan.keyedCurves if cutKeys else []
+                apiRooDict = rooMismatchDict if setRoo else {}
+
+                progress.setPhase("write", len(apiCurves) + len(poseValues) + len(curves) + len(instances))
+
+                def edit(dgMod, animChange):
+                    self.cutApiKeys(keyedCurves, startTime, stopTime, dgMod, animChange)
+                    if apiRooDict:
+                        print("\n### Setting rotation order for target objects:")
+                    self.setApiRotateOrder(apiRooDict, dgMod)
+                    self.writeApiPose(apiValues, dgMod)
+                    self.writeApiCurves(apiCurves, dgMod, animChange, progress)
+
+                try:
+                    self.runApiEdit(edit)
+                except RuntimeError:
+                    # Maya hands exceptions raised inside commands back as RuntimeError.
+                    # PaieApiEdit has undone its part by then
+                    if progress.cancelled:
+                        raise KeyboardInterrupt("# writeToScene >> Procedure cancelled by user")
+                    raise
+            else:
+                progress.setPhase("write", len(poseValues) + len(curves) + len(instances))
+
+                if cutKeys:
+                    # remove existing animation on objs with importAnim data
+                    mc.cutKey(plan.listObjs(), time=(startTime, stopTime), clear=True)
+                if setRoo:
+                    print("\n### Setting rotation order for target objects:")
+                    self.setRotateOrderCmds(rooMismatchDict)
+
+            # Set values
+            self.writePoseCmds(poseValues, progress)
+
+            # Set Keys, Tangents and infinity
+            self.writeCurvesCmds(curves, progress)
+
+            # Hand the written curves on to the remaining targets
+            self.instanceCurves(instances, instanceMode, progress)
+
+        finally:
+            # Progress printing done
+            progress.finish()
+
+
+# Tangent types in the order of their AnimKeys codes. Don't reorder, codes are stored in files
+tangentTypeNames = (
+    'global', 'fixed', 'linear', 'flat', 'spline', 'step', 'slow', 'fast', 'clamped', 'plateau', 'stepnext', 'auto',
+    'autoease', 'automix', 'autocustom',
+)
+
+
+class AnimKeys:
+    """
+    Keys of one animCurve stored as parallel array columns instead of a dict per key.
+    Reads like the old {keyID: {keyword: value}} dict through keys(), [] and get()
+    """
+    floatFields = ('time', 'value', 'inAngle', 'outAngle', 'inWeight', 'outWeight')
+    codeFields = ('inTangentType', 'outTangentType')
+    flagFields = ('lock', 'weightLock', 'breakedown')
+
+    def __init__(self):
+        for field in self.floatFields:
+            setattr(self, field, array('d'))
+        for field in self.codeFields + self.flagFields:
+            setattr(self, field, array('B'))
+
+        # Tangent types not in tangentTypeNames, coded from len(tangentTypeNames) and up
+        self.extraTangentTypes = []
+
+    @classmethod
+    def fromLists(cls, **columns):
+        """Builds AnimKeys from one list per field"""
+        animKeys = cls()
+        for field in cls.floatFields:
+            getattr(animKeys, field).extend([float(val) for val in columns[field]])
+        for field in cls.codeFields:
+            getattr(animKeys, field).extend([animKeys.encodeTangentType(val) for val in columns[field]])
+        for field in cls.flagFields:
+            getattr(animKeys, field).extend([int(val) for val in columns[field]])
+
+        return animKeys
+
+    @classmethod
+    def fromDict(cls, keyDict):
+        """Builds AnimKeys from the {keyID: {keyword: value}} dicts of structVersion 1.0"""
+        animKeys = cls()
+        for keyID in sorted(keyDict):
+            key = keyDict[keyID]
+            animKeys.appendKey(
+                key['time'], key['value'], key['inAngle'], key['outAngle'], key['inWeight'], key['outWeight'],
+                key['inTangentType'], key['outTangentType'], key['lock'], key['weightLock'], key.get('breakedown', 0)
+            )
+
+        return animKeys
+
+    @classmethod
+    def fromBuffer(cls, buffer, offset, keyCount, extraTangentTypes):
+        """
+        Builds AnimKeys on top of a data block written by XadWriter.writeBlock without copying.
+        buffer should be a memoryview, f.x. of an mmap
+        """
+        animKeys = cls.__new__(cls)
+
+        position = offset
+        for field in cls.floatFields:
+            column = buffer[position:position + keyCount * 8].cast('d')
+            if sys.byteorder != 'little':
+                column = array('d', column.tobytes())
+                column.byteswap()
+            setattr(animKeys, field, column)
+            position += keyCount * 8
+
+        for field in cls.codeFields + cls.flagFields:
+            setattr(animKeys, field, buffer[position:position + keyCount])
+            position += keyCount
+
+        animKeys.extraTangentTypes = list(extraTangentTypes)
+        return animKeys
+
+    def __getstate__(self):
+        # Columns read from a buffer are memoryviews. Pickle those as arrays
+        state = dict(self.__dict__)
+        for field in self.floatFields:
+            if not isinstance(state[field], array):
+                state[field] = array('d', state[field].tobytes())
+        for field in self.codeFields + self.flagFields:
+            if not isinstance(state[field], array):
+                state[field] = array('B', state[field].tobytes())
+        return state
+
+    def detach(self):
+        """Copies columns read from a buffer into arrays of their own, so the buffer (f.x. an mmap) can be released"""
+        self.__dict__.update(self.__getstate__())
+
+    def getByteSize(self):
+        size = 0
+        for field in self.floatFields + self.codeFields + self.flagFields:
+            column = getattr(self, field)
+            size += len(column) * column.itemsize
+        return size
+
+    def appendKey(self, time, value, inAngle, outAngle, inWeight, outWeight, inTangentType, outTangentType, lock,
+                  weightLock, breakedown):
+        self.time.append(time)
+        self.value.append(value)
+        self.inAngle.append(inAngle)
+        self.outAngle.append(outAngle)
+        self.inWeight.append(inWeight)
+        self.outWeight.append(outWeight)
+        self.inTangentType.append(self.encodeTangentType(inTangentType))
+        self.outTangentType.append(self.encodeTangentType(outTangentType))
+        self.lock.append(int(lock))
+        self.weightLock.append(int(weightLock))
+        self.breakedown.append(int(breakedown))
+
+    def encodeTangentType(self, name):
+        name = str(name)
+        if name in tangentTypeNames:
+            return tangentTypeNames.index(name)
+
+        if name not in self.extraTangentTypes:
+            self.extraTangentTypes.append(name)
+
+        return len(tangentTypeNames) + self.extraTangentTypes.index(name)
+
+    def decodeTangentType(self, code):
+        if code < len(tangentTypeNames):
+            return tangentTypeNames[code]
+        return self.extraTangentTypes[code - len(tangentTypeNames)]
+
+    def getTangentTypes(self, field):
+        """Returns a list of tangent type names of field ('inTangentType'/'outTangentType')"""
+        return [self.decodeTangentType(code) for code in getattr(self, field)]
+
+    def get(self, keyID, keyword):
+        try:
+            if keyword in self.codeFields:
+                return self.decodeTangentType(getattr(self, keyword)[keyID])
+            elif keyword in self.floatFields or keyword in self.flagFields:
+                return getattr(self, keyword)[keyID]
+        except IndexError:
+            pass
+
+        raise KeyError((keyID, keyword))
+
+    def keys(self):
+        return range(len(self.time))
+
+    def __len__(self):
+        return len(self.time)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __getitem__(self, keyID):
+        keyDict = {}
+        for keyword in self.floatFields + self.codeFields + self.flagFields:
+            keyDict[keyword] = self.get(keyID, keyword)
+        return keyDict
+
+
+def replaceFile(tempPath, filepath):
+    """Moves a finished temp file over filepath in one step, with the permissions a new file would get"""
+    # mkstemp creates files only readable by the owner. Libraries are shared
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tempPath, 0o666 & ~umask)
+    os.replace(tempPath, filepath)
+
+
+class XadWriter:
+    """
+    Writes the indexed binary .xad format (structVersion 2). All numbers are little-endian:
+
+    fixed header:   magic, structVersion, flags, metaOffset, metaLength, indexOffset, indexLength
+                    flags holds the compression method in the low byte and its level in the high byte
+    data blocks:    one per animCurve, 8 byte aligned. float64 columns of AnimKeys.floatFields followed by
+                    uint8 columns of AnimKeys.codeFields and AnimKeys.flagFields, compressed as a whole
+                    when compression is used
+    meta block:     pickled {'header': header, 'namespaces': [namespace, ...]}
+    index block:    pickled content['data'] where each 'animKeys' is replaced by
+                    'block': (offset, keyCount, extraTangentTypes, storedLength)
+    """
+    magic = b'PAIEXAD\x00'
+    fixedHeader = struct.Struct('<8sHHQQQQ')
+    compressionMethods = (None, 'zlib', 'lzma')
+
+    def __init__(self, filepath, header, compression=None, compressionLevel=6):
+        """
+        compression:        None/'none', 'zlib' or 'lzma'
+        compressionLevel:   0-9
+        """
+        if compression == 'none':
+            compression = None
+        if compression not in self.compressionMethods:
+            raise Exception("# XadWriter >> Unknown compression: " + str(compression))
+
+        self.filepath = filepath
+        self.compression = compression
+        self.compressionLevel = int(compressionLevel)
+        self.header = dict(header)
+        self.header['structVersion'] = binaryStructVersion
+        if compression is not None:
+            self.header['compression'] = compression + " " + str(self.compressionLevel)
+        self.flags = self.compressionMethods.index(compression) | (self.compressionLevel << 8)
+        self.index = {}
+
+        # Written next to filepath and moved in place on close(), so filepath is never left half written
+        fileHandle, self.tempPath = tempfile.mkstemp(
+            prefix=os.path.basename(filepath), suffix=".tmp", dir=os.path.dirname(os.path.abspath(filepath))
+        )
+        self.file = os.fdopen(fileHandle, 'wb')
+        # Patched with the real offsets on close()
+        self.file.write(b'\x00' * self.fixedHeader.size)
+
+    def addObject(self, namespace, objID, objDict):
+        """Writes the curves of an object from getObjDict to disk and keeps the rest for the index"""
+        objAttrs = {}
+        for attr in objDict['objAttrs']:
+            attrDict = objDict['objAttrs'][attr]
+            if 'anim' in attrDict['values']:
+                animDict = attrDict['values']['anim']
+                attrDict = {
+                    'values': {
+                        'anim': {'animData': animDict['animData'], 'block': self.writeBlock(animDict['animKeys'])}
+                    }
+                }
+            objAttrs[attr] = attrDict
+
+        if namespace not in self.index:
+            self.index[namespace] = {}
+        self.index[namespace][objID] = {'objData': objDict['objData'], 'objAttrs': objAttrs}
+
+    def writeBlock(self, animKeys):
+        self.file.write(b'\x00' * (-self.file.tell() % 8))
+        offset = self.file.tell()
+
+        columns = []
+        for field in AnimKeys.floatFields:
+            column = getattr(animKeys, field)
+            if sys.byteorder != 'little':
+                column = array('d', column)
+                column.byteswap()
+            columns.append(column)
+
+        for field in AnimKeys.codeFields + AnimKeys.flagFields:
+            columns.append(getattr(animKeys, field))
+
+        if self.compression is None:
+            storedLength = 0
+            for column in columns:
+                storedLength += self.file.write(column)
+        else:
+            data = b''.join([bytes(column) for column in columns])
+            if self.compression == 'zlib':
+                data = zlib.compress(data, self.compressionLevel)
+            else:
+                data = lzma.compress(data, preset=self.compressionLevel)
+            storedLength = self.file.write(data)
+
+        return offset, len(animKeys), list(animKeys.extraTangentTypes), storedLength
+
+    def close(self):
+        meta = pickle.dumps({'header': self.header, 'namespaces': list(self.index)}, -1)
+        index = pickle.dumps(self.index, -1)
+
+        metaOffset = self.file.tell()
+        self.file.write(meta)
+        indexOffset = self.file.tell()
+        self.file.write(index)
+
+        self.file.seek(0)
+        self.file.write(self.fixedHeader.pack(
+            self.magic, binaryStructVersion, self.flags, metaOffset, len(meta), indexOffset, len(index)
+        ))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+        replaceFile(self.tempPath, self.filepath)
+
+    def abort(self):
+        """Drops everything written so far, leaving filepath untouched"""
+        self.file.close()
+        if os.path.exists(self.tempPath):
+            os.remove(self.tempPath)
+
+
+class XadReader:
+    """Reads the indexed binary .xad format written by XadWriter from an open file"""
+
+    def __init__(self, file):
+        self.file = file
+        self.file.seek(0)
+        (magic, self.structVersion, self.flags, self.metaOffset, self.metaLength, self.indexOffset,
+         self.indexLength) = XadWriter.fixedHeader.unpack(self.file.read(XadWriter.fixedHeader.size))
+
+        if magic != XadWriter.magic:
+            raise Exception("# XadReader >> Not an indexed .xad file")
+        if self.structVersion != binaryStructVersion:
+            raise Exception("# XadReader >> Unsupported structVersion: " + str(self.structVersion))
+
+        compressionMethod = self.flags & 0xff
+        if compressionMethod >= len(XadWriter.compressionMethods):
+            raise Exception("# XadReader >> Unsupported compression: " + str(compressionMethod))
+        self.compression = XadWriter.compressionMethods[compressionMethod]
+        self.compressionLevel = self.flags >> 8
+
+    @staticmethod
+    def isXad(file):
+        """Checks for the binary format magic and rewinds the file"""
+        file.seek(0)
+        magic = file.read(len(XadWriter.magic))
+        file.seek(0)
+        return magic == XadWriter.magic
+
+    def readBlock(self, offset, length):
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def readMeta(self):
+        return pickle.loads(self.readBlock(self.metaOffset, self.metaLength))
+
+    def readIndex(self):
+        return pickle.loads(self.readBlock(self.indexOffset, self.indexLength))
+
+    def decompress(self, data):
+        if self.compression == 'zlib':
+            return zlib.decompress(data)
+        return lzma.decompress(data)
+
+    def readContainer(self, namespace=None, objNames=None):
+        """
+        Returns a DataContainer with the keys of all curves mapped straight from the file.
+        namespace and objNames limit it to those objects as in DataContainer.filterData
+        """
+        meta = self.readMeta()
+        index = DataContainer.filterDataDict(self.readIndex(), namespace, objNames)
+
+        animDicts = []
+        for namespace in index:
+            for objID in index[namespace]:
+                objAttrs = index[namespace][objID]['objAttrs']
+                for attr in objAttrs:
+                    if 'anim' in objAttrs[attr]['values']:
+                        animDicts.append(objAttrs[attr]['values']['anim'])
+
+        buffer = memoryview(mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ))
+        if self.compression is None:
+            for animDict in animDicts:
+                offset, keyCount, extraTangentTypes, storedLength = animDict.pop('block')
+                animDict['animKeys'] = AnimKeys.fromBuffer(buffer, offset, keyCount, extraTangentTypes)
+        else:
+            blocks = [animDict.pop('block') for animDict in animDicts]
+            with ThreadPoolExecutor(decodeThreads) as pool:
+                decoded = pool.map(lambda block: self.decompress(buffer[block[0]:block[0] + block[3]]), blocks)
+                for animDict, block, data in zip(animDicts, blocks, decoded):
+                    animDict['animKeys'] = AnimKeys.fromBuffer(memoryview(data), 0, block[1], block[2])
+
+        dataObj = DataContainer({'header': meta['header'], 'data': index})
+        dataObj.structVersion = structVersion
+        return dataObj
+
+
+class LibraryIndex:
+    """
+    Sidecar index of the paie files in a library directory, stored as a pickle in the directory itself.
+    Holds header, namespaces, object names, size and mtime of each file and only re-reads files whose size
+    or mtime changed. Binary files are read on refresh, as their header and index are read without decoding any
+    curves. Pickled files have to be loaded in full, so they are only read once getEntry asks for them.
+    Use LibraryIndex.get() to share one instance per directory within the session
+    """
+    indexFilename = ".paieIndex"
+    indexVersion = 2
+    openIndexes = {}
+
+    def __init__(self, dirPath, fileExt=".xad"):
+        self.dirPath = dirPath
+        self.fileExt = fileExt
+        self.entries = {}
+        self.scanned = False
+        self.load()
+
+    @classmethod
+    def get(cls, dirPath, fileExt=".xad"):
+        key = (os.path.normpath(dirPath), fileExt)
+        if key not in cls.openIndexes:
+            cls.openIndexes[key] = cls(dirPath, fileExt)
+        return cls.openIndexes[key]
+
+    def getIndexPath(self):
+        return os.path.join(self.dirPath, self.indexFilename)
+
+    def getFilePath(self, name):
+        return os.path.join(self.dirPath, name + self.fileExt)
+
+    def load(self):
+        try:
+            with open(self.getIndexPath(), 'rb') as file:
+                indexDict = pickle.load(file)
+            if indexDict['indexVersion'] == self.indexVersion and indexDict['fileExt'] == self.fileExt:
+                self.entries = indexDict['entries']
+        except Exception:
+            # Missing or unreadable indexes are rebuilt on refresh()
+            self.entries = {}
+
+    def save(self):
+        """Writes the index next to the files. Silently skipped on read-only libraries"""
+        indexDict = {'indexVersion': self.indexVersion, 'fileExt': self.fileExt, 'entries': self.entries}
+        try:
+            fileHandle, tempPath = tempfile.mkstemp(prefix=self.indexFilename, dir=self.dirPath)
+        except (IOError, OSError):
+            return
+
+        try:
+            with os.fdopen(fileHandle, 'wb') as file:
+                pickle.dump(indexDict, file, -1)
+
+            replaceFile(tempPath, self.getIndexPath())
+        except (IOError, OSError):
+            if debugger:
+                traceback.print_exc()
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+
+    def readEntry(self, name, stat, loadPickles=True):
+        """
+        Reads header, namespaces and object names of a file. Binary files only have their meta and index read,
+        without decoding any curves. Pickled files are skipped without loadPickles, leaving an entry with 'read'
+        off for getEntry to fill in
+        """
+        entry = {
+            'size': stat.st_size, 'mtime': stat.st_mtime, 'read': True, 'header': None, 'namespaces': [],
+            'objects': {}, 'structVersion': None,
+        }
+
+        try:
+            file = open(self.getFilePath(name), 'rb')
+        except IOError:
+            print("# LibraryIndex.readEntry >> Could not open file: " + self.getFilePath(name))
+            return entry
+
+        with file:
+            if XadReader.isXad(file):
+                try:
+                    reader = XadReader(file)
+                    entry['structVersion'] = reader.structVersion
+                    meta = reader.readMeta()
+                    index = reader.readIndex()
+                except Exception:
+                    return entry
+
+                entry['header'] = meta['header']
+                entry['namespaces'] = meta['namespaces']
+                for namespace in index:
+                    entry['objects'][namespace] = [
+                        index[namespace][objID]['objData']['fullPath'] for objID in index[namespace]
+                    ]
+                return entry
+
+        if not loadPickles:
+            entry['read'] = False
+            return entry
+
+        wrapperObj = DataWrapper()
+        if wrapperObj.load(self.getFilePath(name)):
+            entry['header'] = wrapperObj.dataObj.content['header']
+            entry['namespaces'] = wrapperObj.dataObj.listNamespaces()
+            for namespace in entry['namespaces']:
+                entry['objects'][namespace] = wrapperObj.dataObj.listObjs(namespace)
+        entry['structVersion'] = wrapperObj.loadedVersion
+
+        return entry
+
+    def isCurrent(self, name, stat):
+        entry = self.entries.get(name)
+        return entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime
+
+    def refresh(self):
+        """Lists the directory once and re-reads new or changed files"""
+        changed = False
+        found = set()
+        for dirEntry in os.scandir(self.dirPath):
+            name, ext = os.path.splitext(dirEntry.name)
+            if ext != self.fileExt or not dirEntry.is_file():
+                continue
+
+            found.add(name)
+            stat = dirEntry.stat()
+            if not self.isCurrent(name, stat):
+                self.entries[name] = self.readEntry(name, stat, loadPickles=False)
+                changed = True
+
+        for name in list(self.entries):
+            if name not in found:
+                self.entries.pop(name)
+                changed = True
+
+        self.scanned = True
+        if changed:
+            self.save()
+
+    def update(self, name, contents=None):
+        """
+        Re-reads a single file, f.x. after exporting it. Pickled files are left for getEntry, unless the exporter
+        passes their contents along as returned by DataWrapper.getIndexContents
+        """
+        try:
+            stat = os.stat(self.getFilePath(name))
+        except OSError:
+            self.remove(name)
+            return None
+
+        if contents is not None:
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'read': True}
+            entry.update(contents)
+            self.entries[name] = entry
+            self.save()
+        elif not self.isCurrent(name, stat):
+            self.entries[name] = self.readEntry(name, stat, loadPickles=False)
+            self.save()
+
+        return self.entries[name]
+
+    def remove(self, name):
+        if self.entries.pop(name, None) is not None:
+            self.save()
+
+    def getEntry(self, name):
+        """Returns the entry of a file, reading it if it changed since it was indexed or wasn't read yet"""
+        entry = self.update(name)
+        if entry is not None and not entry['read']:
+            entry = self.readEntry(name, os.stat(self.getFilePath(name)))
+            self.entries[name] = entry
+            self.save()
+
+        return entry
+
+    def listFiles(self):
+        return sorted(self.entries)
+
+
+class SelectionIndex:
+    """
+    Names of a selection list, split once per export/import:
+        paths:          full paths as selected
+        leafNames:      last object in each path, namespace included
+        shortNames:     leafNames stripped from namespaces
+        namespaces:     namespace of each object ("none" when there is none)
+        strippedPaths:  full paths with every level stripped from namespaces, as stored in files
+    """
+
+    def __init__(self, selList):
+        if type(selList) != type([]):
+            raise Exception("# SelectionIndex >> Input isn't a list")
+
+        self.paths = selList
+        self.leafNames = []
+        self.shortNames = []
+        self.namespaces = []
+        self.strippedPaths = []
+
+        for path in selList:
+            levels = path.split("|")
+            leafName = levels[-1]
+            shortName = leafName.split(":")[-1]
+
+            if len(shortName) == len(leafName):  # No namespace
+                namespace = "none"
+            else:
+                namespace = sys.intern(leafName[: len(shortName) * -1])  # gets full namespace
+
+            strippedPath = ""
+            for lvl in levels[1:]:
+                strippedPath += "|" + lvl.split(":")[-1]
+
+            self.leafNames.append(leafName)
+            self.shortNames.append(shortName)
+            self.namespaces.append(namespace)
+            self.strippedPaths.append(strippedPath)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def listNamespaces(self):
+        """Namespaces in selection order, without duplicates"""
+        return list(dict.fromkeys(self.namespaces))
+
+    def listClashingNames(self):
+        """leafNames occurring more than once"""
+        seen = set()
+        clashedNames = []
+        for leafName in self.leafNames:
+            if leafName in seen:
+                clashedNames.append(leafName)
+            else:
+                seen.add(leafName)
+
+        return clashedNames
+
+    def mapToFile(self, objIdDict):
+        """
+        Maps file objects onto the selection by name.
+        objIdDict: objID -> stripped fullPath, as returned by DataContainer.getObjIdDict()
+        Returns objID -> selected full path
+        """
+        fileIdByName = {}
+        for objID in objIdDict:
+            fileIdByName.setdefault(objIdDict[objID].split("|")[-1], objID)
 
-            except TypeError:
-                nonExistingObjs.append(mutualObjs[i])  # Saved for future reference
+        outputDict = {}
+        for i in range(len(self.paths)):
+            objID = fileIdByName.pop(self.shortNames[i], None)
+            if objID is not None:
+                outputDict[objID] = self.paths[i]
 
-            else:
-                objList.append(mutualObjs[i])  # Containing all existing objects as a list
-                existObjIdIter.append(i)  # Containing ID's on existing objects
+        return outputDict
 
-        if self.dataObj.getHeaderAttr('filetype') == 'anim':
-            if isKey:
-                proceed = mc.confirmDialog(
-                    title="Keys exist",
-                    message=("Keys already exist in framerange: " + str(startTime) + '-' + str(stopTime) + '\nOverrwrite?'),
-                    button=["Yes", "No"], defaultButton="Yes", cancelButton="No", dismissString="No"
-                )
-                if proceed == 'No':
-                    raise KeyboardInterrupt("# writeToScene >> Procedure cancelled by user")
+    def mapToFileTargets(self, objIdDict):
+        """
+        Maps file objects onto the selection by name, once per namespace in the selection, through a single
+        name table. Returns a list of (objID, selected full path)
+        """
+        fileIdByName = {}
+        for objID in objIdDict:
+            fileIdByName.setdefault(objIdDict[objID].split("|")[-1], objID)
 
-                # remove existing animation on objs with importAnim data
-                mc.cutKey(objList, time=(startTime, stopTime), clear=True)
+        targets = []
+        mapped = set()
+        for i in range(len(self.paths)):
+            objID = fileIdByName.get(self.shortNames[i])
+            if objID is not None and (self.namespaces[i], objID) not in mapped:
+                mapped.add((self.namespaces[i], objID))
+                targets.append((objID, self.paths[i]))
 
-        # Starting to write data
-        skippedAttrs = []
+        return targets
 
-        if debugger == 2:
-            print("# write keys start: ".ljust(30), time.clock())
+    def mapSelectionOrderTargets(self):
+        """Maps objIDs onto the selection by selection order, restarting at 0 in each namespace"""
+        targets = []
+        objCounts = {}
+        for i in range(len(self.paths)):
+            objID = objCounts.get(self.namespaces[i], 0)
+            objCounts[self.namespaces[i]] = objID + 1
+            targets.append((objID, self.paths[i]))
 
-        # Checks for dismatching rotation order and whatever else on objects before writing
-        rooMismatchDict = {}
-        for objID in existObjIdIter:
-            obj = mutualObjs[objID]
+        return targets
 
-            # check rotate order
-            if mc.objExists(obj + '.rotateOrder'):
-                currRoo = mc.getAttr(obj + '.rotateOrder')
-                importRoo = self.dataObj.getObjDataVal(objID, 'rotateOrder')
 
-                if currRoo != importRoo:
-                    rooMismatchDict[obj] = {"currentRoo": currRoo, "sourceRoo": importRoo}
-            else:
-                # out commented to enable transfer from shape-nodes
-                pass
-                # raise Exception, "# writeToScene >> objs without rotateOrder attribute?: " + obj
+class ImportPlan:
+    """
+    Target state of an import, gathered by DataWrapper.getImportPlan before anything is written:
+        targets:            (objID, target object) of existing targets, in import order. An objID can have
+                            several targets when importing onto multiple namespaces
+        nonExistingObjs:    targets that don't exist
+        keyCount:           number of existing keys in the import framerange on the targets
+        keyedCurves:        animCurves holding those keys, when gathered through OpenMaya
+        rooMismatches:      target -> {"currentRoo": int, "sourceRoo": int}
+        plugs:              (objID, obj, attr) of every writable target attribute
+        missingAttrs:       target plugs that don't exist
+        lockedPlugs:        target plugs that are locked
+        connectedPlugs:     target plugs of pose values driven by anything but an animCurve
+        apiPlugs:           plugName -> MPlug of each target attribute, when gathered through OpenMaya
+        curves:             flat curveData per animated attribute, filled by DataWrapper.compileImport
+        poseValues:         (plugName, value) per static attribute, filled by DataWrapper.compileImport
+    """
 
-        if len(rooMismatchDict.values()):
-            proceed = "Yes"
-            print("\n### Target objects with mismatching rotation order:")
-            for key in rooMismatchDict:
-                print(
-                    key.split("|")[-1] + ": source roo: " + str(rooMismatchDict[key]["sourceRoo"])
-                    + ", target roo: " + str(rooMismatchDict[key]["currentRoo"])
+    def __init__(self):
+        self.targets = []
+        self.nonExistingObjs = []
+        self.keyCount = 0
+        self.keyedCurves = []
+        self.rooMismatches = {}
+        self.plugs = []
+        self.missingAttrs = []
+        self.lockedPlugs = []
+        self.connectedPlugs = []
+        self.apiPlugs = {}
+        self.curves = []
+        self.poseValues = []
+
+    def listObjs(self):
+        return [obj for objID, obj in self.targets]
+
+    def printReport(self):
+        print("# ImportPlan >> " + str(len(self.targets)) + " objects, " + str(len(self.plugs)) + " attributes, "
+              + str(self.keyCount) + " existing keys in framerange")
+        for label, plugList in (("Missing objects", self.nonExistingObjs), ("Missing attributes", self.missingAttrs),
+                                ("Locked attributes", self.lockedPlugs),
+                                ("Connected attributes", self.connectedPlugs)):
+            if plugList:
+                print("### " + label + ": " + ", ".join(plugList))
+
+
+class SchemaCache:
+    """
+    Session cache of attribute schemas: keyable/all attribute lists and rotateOrder presence.
+    Referenced nodes share a schema per node type, reference file and name without namespace, so every instance of
+    a rig is only queried once. Other nodes get a schema of their own.
+    Lock state differs between instances, so it isn't part of a schema: the attribute lists include locked
+    attributes and callers check locks per node.
+    A schema is dropped once an attribute of a node using it is added or removed, and the whole cache on scene
+    new/open. Keyable state changed after a node got cached is only picked up after SchemaCache.clear()
+    """
+    schemas = {}
+    nodeSignatures = {}
+    referenceFiles = {}
+    callbackIds = []
+    sceneCallbackIds = []
+    hits = 0
+    misses = 0
+
+    @classmethod
+    def get(cls, objFullPath, nodeObj=None):
+        """
+        Returns (schema, MObject) of objFullPath, reading the schema on a cache miss. nodeObj saves resolving
+        the node when the caller has it already. Returns (None, None) for nonexisting objects
+        """
+        if nodeObj is None:
+            selList = om.MSelectionList()
+            try:
+                selList.add(objFullPath)
+                nodeObj = selList.getDependNode(0)
+            except (RuntimeError, TypeError):
+                return None, None
+
+        signature = cls.getSignature(objFullPath, nodeObj)
+        if signature in cls.schemas:
+            cls.hits += 1
+        else:
+            cls.misses += 1
+            cls.schemas[signature] = cls.readSchema(objFullPath)
+
+        return cls.schemas[signature], nodeObj
+
+    @classmethod
+    def getSignature(cls, objFullPath, nodeObj):
+        handle = om.MObjectHandle(nodeObj)
+        entry = cls.nodeSignatures.get(handle.hashCode())
+        if entry is not None and entry[0].isValid() and entry[0].object() == nodeObj:
+            return entry[1]
+
+        node = om.MFnDependencyNode(nodeObj)
+        if node.isFromReferencedFile:
+            leafName = objFullPath.split("|")[-1]
+            namespace = leafName[: len(leafName.split(":")[-1]) * -1]
+            if namespace not in cls.referenceFiles:
+                cls.referenceFiles[namespace] = mc.referenceQuery(
+                    objFullPath, filename=True, withoutCopyNumber=True
                 )
+            strippedPath = "|".join([lvl.split(":")[-1] for lvl in objFullPath.split("|")])
+            signature = (node.typeName, cls.referenceFiles[namespace], strippedPath)
+        else:
+            signature = (node.typeName, None, objFullPath)
+
+        cls.nodeSignatures[handle.hashCode()] = (handle, signature)
+        cls.addCallbacks(nodeObj)
+
+        return signature
+
+    @staticmethod
+    def readSchema(objFullPath):
+        return {
+            'keyable': mc.listAttr(objFullPath, keyable=True, visible=True, scalar=True, multi=True) or [],
+            'all': mc.listAttr(objFullPath, scalar=True, multi=True) or [],
+            'hasRotateOrder': mc.objExists(objFullPath + '.rotateOrder'),
+        }
+
+    @classmethod
+    def addCallbacks(cls, nodeObj):
+        if not cls.sceneCallbackIds:
+            for message in (om.MSceneMessage.kBeforeNew, om.MSceneMessage.kBeforeOpen):
+                cls.sceneCallbackIds.append(om.MSceneMessage.addCallback(message, cls.onSceneChange))
+
+        cls.callbackIds.append(om.MNodeMessage.addAttributeAddedOrRemovedCallback(nodeObj, cls.onAttributeAdded))
+
+    @classmethod
+    def invalidate(cls, nodeObj):
+        entry = cls.nodeSignatures.get(om.MObjectHandle(nodeObj).hashCode())
+        if entry is not None:
+            cls.schemas.pop(entry[1], None)
+
+    @classmethod
+    def onAttributeAdded(cls, msg, plug, clientData):
+        cls.invalidate(plug.node())
+
+    @classmethod
+    def onSceneChange(cls, clientData):
+        cls.clear()
+
+    @classmethod
+    def clear(cls):
+        for callbackId in cls.callbackIds:
+            try:
+                om.MMessage.removeCallback(callbackId)
+            except RuntimeError:
+                # Callbacks of deleted nodes are gone already
+                pass
 
-            proceed = mc.confirmDialog(
-                title="Keys exist",
-                message=(
-                    "One or more objects rotation order dismatches import values. \nMatch target rotationOrder to source?"),
-                button=["Yes", "No"],
-                defaultButton="Yes",
-                cancelButton="No",
-                dismissString="No"
-            )
-
-            if proceed == "Yes":
-                print("\n### Setting rotation order for target objects:")
-                for key in rooMismatchDict:
-                    print("### " + key.split("|")[-1] + '.rotateOrder -> ' + str(rooMismatchDict[key]["sourceRoo"]))
-                    try:
-                        mc.setAttr(key + '.rotateOrder', rooMismatchDict[key]["sourceRoo"])
-                    except Exception as e:
-                        print(e)
-                        print("### Failed to set Rotation Order on object...It's probably locked")
+        cls.callbackIds = []
+        cls.schemas = {}
+        cls.nodeSignatures = {}
+        cls.referenceFiles = {}
 
-            elif proceed == "No":
-                print("### Not touching rotation order...")
-                # raise KeyboardInterrupt, "# writeToScene >> Procedure cancelled by user"
 
-        # Initializing progress handler
-        progress = ProgressHandler(len(existObjIdIter), "Importing Data")
-        progress.printStatus()
+class ClipCache:
+    """
+    Session LRU cache of decoded files used by DataWrapper.loadCached, for applying the same poses and clips
+    over and over. Keeps the DataContainers DataWrapper.load decoded for a namespace and objNames filter, up to
+    paie.clipCacheBudget bytes estimated from their key columns. A filter is served by its own entry or by an
+    unfiltered one. Hands out views, so callers are free to clear what they get.
+    Entries are checked against the mtime and size of their file on every get and dropped when the file is
+    saved through DataWrapper.save
+    """
+    # Estimated bytes per attribute besides its keys (dicts, names, animData)
+    attrOverhead = 512
+
+    entries = OrderedDict()
+    totalSize = 0
+    hits = 0
+    misses = 0
+
+    @staticmethod
+    def getPath(filepath):
+        return os.path.normcase(os.path.abspath(filepath))
+
+    @classmethod
+    def getKey(cls, filepath, namespace=None, objNames=None):
+        if objNames is not None:
+            objNames = frozenset(objNames)
+        return cls.getPath(filepath), namespace, objNames
+
+    @classmethod
+    def get(cls, filepath, stat, namespace=None, objNames=None):
+        """
+        Returns the entry holding namespace and objNames of filepath if it's cached and the file didn't change
+        since. None otherwise
+        """
+        for key in (cls.getKey(filepath, namespace, objNames), cls.getKey(filepath)):
+            entry = cls.entries.get(key)
+            if entry is None:
+                continue
 
-        # Starting to write to scene
-        for objID in existObjIdIter:
-            obj = mutualObjs[objID]
-
-            # Progress printing
-            progress.printStatus()
-
-            for attr in self.dataObj.listObjAttrs(objID):
-                if mc.objExists(obj + '.' + attr):
-                    if self.dataObj.hasAnim(objID, attr):
-                        # Set Keys
-                        for key in self.dataObj.getAttrKeyID(objID, attr):
-
-                            ### This is hacked. Change back soon!
-                            ######################################################################################################
-
-                            frameNr = float(self.dataObj.getKeyAnimData(objID, attr, key, 'time')) + animOffset
-                            ### maya 2010 bugfix - can't set rotation values with setKeyframe when on animLayers
-                            # if attr in ("rotateX", "rotateY", "rotateZ"):
-                            # mc.currentTime( frameNr )
-                            # try:
-                            # mc.setAttr(obj + "." + attr, float(self.dataObj.getKeyAnimData(objID, attr, key, 'value')))
-                            # mc.setKeyframe(obj , time =  frameNr  , attribute = str(attr), breakdown=False, hierarchy='none', controlPoints=False, shape=False )
-                            # except:
-                            # pass
-
-                            # else:
-                            # mc.setKeyframe(obj , time =  frameNr  , attribute = str(attr)  , value =  float(self.dataObj.getKeyAnimData(objID, attr, key, 'value')), breakdown=False, hierarchy='none', controlPoints=False, shape=False )
-
-                            mc.setKeyframe(
-                                obj, time=frameNr, attribute=str(attr),
-                                value=float(self.dataObj.getKeyAnimData(objID, attr, key, 'value')), breakdown=False,
-                                hierarchy='none', controlPoints=False, shape=False
-                            )
-
-                        # Set Tangents
-                        mc.keyTangent(
-                            obj + '.' + attr, edit=True, wt=int(self.dataObj.getAttrData(objID, attr, 'weightedTangents'))
-                        )
+            if entry['stat'] != (stat.st_mtime_ns, stat.st_size):
+                cls.invalidate(filepath)
+                break
 
-                        for keyID in self.dataObj.getAttrKeyID(objID, attr):
-
-                            try:
-                                frameNr = (float(self.dataObj.getKeyAnimData(objID, attr, keyID, 'time')) + animOffset)
-
-                                inAngleVal = float(self.dataObj.getKeyAnimData(objID, attr, keyID, 'inAngle'))
-                                outAngleVal = float(self.dataObj.getKeyAnimData(objID, attr, keyID, 'outAngle'))
-                                inWeightVal = float(self.dataObj.getKeyAnimData(objID, attr, keyID, 'inWeight'))
-                                outWeightVal = float(self.dataObj.getKeyAnimData(objID, attr, keyID, 'outWeight'))
-                                inTangentTypeVal = str(self.dataObj.getKeyAnimData(objID, attr, keyID, 'inTangentType'))
-                                outTangentTypeVal = str(self.dataObj.getKeyAnimData(objID, attr, keyID, 'outTangentType'))
-                                lockVal = int(self.dataObj.getKeyAnimData(objID, attr, keyID, 'lock'))
-
-                                mc.keyTangent(
-                                    obj + '.' + attr, time=(frameNr, frameNr), edit=True, inAngle=inAngleVal,
-                                    outAngle=outAngleVal, inWeight=inWeightVal, outWeight=outWeightVal
-                                )
-                                mc.keyTangent(
-                                    obj + '.' + attr, time=(frameNr, frameNr), edit=True, inTangentType=inTangentTypeVal,
-                                    outTangentType=outTangentTypeVal
-                                )
-                                mc.keyTangent(obj + '.' + attr, time=(frameNr, frameNr), edit=True, lock=lockVal)
-                                if int(self.dataObj.getAttrData(objID, attr, 'weightedTangents')):
-
-                                    weightLockVal = int(self.dataObj.getKeyAnimData(objID, attr, keyID, 'weightLock'))
-                                    mc.keyTangent(
-                                        obj + '.' + attr, time=(frameNr, frameNr), edit=True, weightLock=weightLockVal
-                                    )
-                            except Exception as e:
-                                print(e)
-                                print("# paie.writeToScene caught this kind of error while applying keyframes:")
-                                raise
-
-                        ###	Setting infinity
-                        preInfinity = self.dataObj.getAttrData(objID, attr, "preInfinity")
-                        postInfinity = self.dataObj.getAttrData(objID, attr, "postInfinity")
-
-                        if preInfinity != "constant":
-                            mc.setInfinity(obj, attribute=attr, pri=preInfinity)
-
-                        if postInfinity != "constant":
-                            mc.setInfinity(obj, attribute=attr, poi=postInfinity)
-                    else:
-                        # set attribute value with setAttr if it is different than current value
-                        currentVal = mc.getAttr(obj + '.' + attr)
-                        importValue = self.dataObj.getAttrData(objID, attr, 'value')
+            cls.entries.move_to_end(key)
+            cls.hits += 1
+            return entry
 
-                        if currentVal != importValue:
-                            try:
-                                mc.setAttr(obj + '.' + attr, importValue)
-                            except:
-                                print("# writeToScene >> " + obj + '.' + attr + " cannot be modified. Skipping...")
+        cls.misses += 1
+        return None
 
-        # Progress printing done
-        progress.finish()
+    @classmethod
+    def add(cls, filepath, stat, namespace, objNames, dataObj, loadedVersion):
+        """
+        Caches dataObj as loaded with namespace and objNames, dropping the least recently used entries to stay
+        within budget. Returns the entry, which is only stored if it fits the budget at all
+        """
+        entry = {
+            'stat': (stat.st_mtime_ns, stat.st_size), 'dataObj': dataObj, 'loadedVersion': loadedVersion,
+            'size': cls.estimateSize(dataObj),
+        }
+        if entry['size'] > clipCacheBudget:
+            return entry
+
+        # Keys mapped from the file would keep it open (and locked on Windows) as long as they are cached.
+        # Only the decoded objects are copied
+        for animDict in cls.listAnimDicts(dataObj):
+            animDict['animKeys'].detach()
+
+        key = cls.getKey(filepath, namespace, objNames)
+        if key in cls.entries:
+            cls.totalSize -= cls.entries.pop(key)['size']
+        while cls.entries and cls.totalSize + entry['size'] > clipCacheBudget:
+            cls.totalSize -= cls.entries.popitem(last=False)[1]['size']
+
+        cls.entries[key] = entry
+        cls.totalSize += entry['size']
+        return entry
+
+    @staticmethod
+    def getView(dataObj, namespace=None, objNames=None):
+        """A DataContainer sharing the data of dataObj, filtered like DataContainer.filterData"""
+        view = DataContainer({
+            'header': dict(dataObj.content['header']),
+            'data': DataContainer.filterDataDict(dataObj.content['data'], namespace, objNames),
+        })
+        view.structVersion = dataObj.structVersion
+        return view
+
+    @staticmethod
+    def listAnimDicts(dataObj):
+        animDicts = []
+        for namespace in dataObj.content['data']:
+            for objID in dataObj.content['data'][namespace]:
+                objAttrs = dataObj.content['data'][namespace][objID]['objAttrs']
+                for attr in objAttrs:
+                    if 'anim' in objAttrs[attr]['values']:
+                        animDicts.append(objAttrs[attr]['values']['anim'])
+        return animDicts
+
+    @classmethod
+    def estimateSize(cls, dataObj):
+        size = 0
+        for namespace in dataObj.content['data']:
+            for objID in dataObj.content['data'][namespace]:
+                size += cls.attrOverhead * len(dataObj.content['data'][namespace][objID]['objAttrs'])
+        for animDict in cls.listAnimDicts(dataObj):
+            size += animDict['animKeys'].getByteSize()
+        return size
+
+    @classmethod
+    def invalidate(cls, filepath):
+        """Drops every entry of filepath"""
+        path = cls.getPath(filepath)
+        for key in [key for key in cls.entries if key[0] == path]:
+            cls.totalSize -= cls.entries.pop(key)['size']
+
+    @classmethod
+    def clear(cls):
+        cls.entries.clear()
+        cls.totalSize = 0
+
+    @classmethod
+    def getStats(cls):
+        return {
+            'entries': len(cls.entries), 'size': cls.totalSize, 'budget': clipCacheBudget, 'hits': cls.hits,
+            'misses': cls.misses,
+        }
+
+    @classmethod
+    def printStats(cls):
+        print("# ClipCache >> " + str(len(cls.entries)) + " entries, " + "%.1f" % (cls.totalSize / 1048576.0) + " of "
+              + "%.1f" % (clipCacheBudget / 1048576.0) + " MB, " + str(cls.hits) + " hits, " + str(cls.misses)
+              + " misses")
 
 
 class DataContainer:
@@ -628,9 +2691,61 @@ class DataContainer:
         self.defaultNamespace = 'none'
         self.structVersion = None
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+        if self.structVersion in legacyStructVersions:
+            self.convertLegacyContent()
+
+    def convertLegacyContent(self):
+        """Converts per-key dicts of older structure versions to AnimKeys and interns names"""
+        for namespace in list(self.content['data']):
+            namespaceData = self.content['data'].pop(namespace)
+            for objID in namespaceData:
+                objDict = namespaceData[objID]
+                objDict['objData']['fullPath'] = sys.intern(objDict['objData']['fullPath'])
+
+                objAttrs = {}
+                for attr in objDict['objAttrs']:
+                    attrDict = objDict['objAttrs'][attr]
+                    if 'anim' in attrDict['values']:
+                        animDict = attrDict['values']['anim']
+                        animDict['animKeys'] = AnimKeys.fromDict(animDict['animKeys'])
+                    objAttrs[sys.intern(attr)] = attrDict
+                objDict['objAttrs'] = objAttrs
+
+            self.content['data'][sys.intern(namespace)] = namespaceData
+
+        self.structVersion = structVersion
+
     def clear(self):
         self.__dict__.clear()
 
+    @staticmethod
+    def filterDataDict(data, namespace=None, objNames=None):
+        """Returns the part of a content['data'] dict matching namespace and objNames (see filterData)"""
+        if namespace is not None:
+            data = {ns: data[ns] for ns in data if ns == namespace}
+
+        if objNames is not None:
+            objNames = set(objNames)
+            filtered = {}
+            for ns in data:
+                filtered[ns] = {}
+                for objID in data[ns]:
+                    if data[ns][objID]['objData']['fullPath'].split("|")[-1] in objNames:
+                        filtered[ns][objID] = data[ns][objID]
+            data = filtered
+
+        return data
+
+    def filterData(self, namespace=None, objNames=None):
+        """
+        Drops all namespaces but namespace, and all objects whose name (without path or namespace) isn't
+        in objNames. None keeps everything
+        """
+        self.content['data'] = self.filterDataDict(self.content['data'], namespace, objNames)
+
     def hasContent(self):
         returnVal = 0
 
@@ -721,12 +2836,20 @@ class DataContainer:
 
         return returnVal
 
+    def getAnimKeys(self, objID, attr):
+        """Returns the AnimKeys columns of an attribute"""
+        try:
+            return self.content['data'][self.defaultNamespace][objID]['objAttrs'][attr]['values']['anim']['animKeys']
+        except KeyError:
+            print("# defaultNamespace: ", self.defaultNamespace)
+            print("# ObjID: ", objID)
+            print("# Attr: ", attr)
+            raise KeyError
+
     def getKeyAnimData(self, objID, attr, keyID, keyword):
         try:
-            returnVal = \
-                self.content['data'][self.defaultNamespace][objID]['objAttrs'][attr]['values']['anim']['animKeys'][
-                    keyID][
-                    keyword]
+            animDict = self.content['data'][self.defaultNamespace][objID]['objAttrs'][attr]['values']['anim']
+            returnVal = animDict['animKeys'].get(keyID, keyword)
         except KeyError:
             print("# defaultNamespace: ", self.defaultNamespace)
             print("# objID: ", objID)
@@ -753,6 +2876,15 @@ class DataContainer:
             print("# Keyword: ", keyword)
             raise KeyError
 
+    def getObjAttrDict(self, objID):
+        """Returns the attribute dicts of an object in the default namespace, for reading many attributes at once"""
+        try:
+            return self.content['data'][self.defaultNamespace][objID]['objAttrs']
+        except KeyError:
+            print("# defaultNamespace: ", self.defaultNamespace)
+            print("# objID: ", objID)
+            raise KeyError
+
     def listObjAttrs(self, objID, namespace=None):
         attrList = []
 
@@ -836,62 +2968,99 @@ class DataContainer:
 
 class ProgressHandler:
     """
-    Class for handling progress notifiers
+    Class for handling progress notifiers.
+    Updates at most paie.progressRate times per second, and only when the whole percentage changed.
+    Progress is reported per phase (f.x. 'query', 'write'). printStatus() raises KeyboardInterrupt once the
+    progress window is cancelled or cancel() was called, so callers abort before touching the next object
     """
 
-    def __init__(self, steps, jobType):
+    def __init__(self, steps, jobType, phase=None):
         if type(steps) != type(1):
             raise Exception("# ProgressHandler.__init__() >> Input Error")
 
-        self.stepSize = 100.0 / float(steps)
-        self.curStatus = 0
+        self.jobType = jobType
+        self.cancelled = False
 
         if platformCase == "ms":
             self.os = "windows"
-            mc.progressWindow(title=jobType, progress=0, status="Initializing progress bar", isInterruptable=False)
+            mc.progressWindow(title=jobType, progress=0, status="Initializing progress bar", isInterruptable=True)
         else:
             self.os = sys.platform
             print("# Initializing progressBar")
 
+        self.setPhase(phase, steps)
+
+    def setPhase(self, phase, steps):
+        """Starts counting steps of a new phase from 0%"""
+        self.phase = phase
+        self.stepSize = 100.0 / float(max(steps, 1))
+        self.curStatus = 0
+        self.lastPercent = None
+        self.lastUpdate = 0.0
+
     def printStatus(self):
-        if self.os == "windows":
-            self.__windowsPrint()
+        percent = min(int(self.curStatus), 100)
+        self.__next()
 
-        else:
-            self.__linuxPrint()
+        now = time.perf_counter()
+        if now - self.lastUpdate >= 1.0 / progressRate:
+            self.lastUpdate = now
+
+            if self.os == "windows" and mc.progressWindow(query=True, isCancelled=True):
+                self.cancelled = True
+
+            if percent != self.lastPercent:
+                self.lastPercent = percent
+                if self.os == "windows":
+                    self.__windowsPrint(percent)
+                else:
+                    self.__linuxPrint(percent)
+
+        if self.cancelled:
+            raise KeyboardInterrupt("# ProgressHandler >> " + self.jobType + " was cancelled")
+
+    def cancel(self):
+        self.cancelled = True
 
     def finish(self):
         if self.os == "windows":
             mc.progressWindow(endProgress=True)
+        elif not self.cancelled and self.lastPercent != 100:
+            self.__linuxPrint(100)
 
     def __next(self):
         self.curStatus += self.stepSize
 
-    def __windowsPrint(self):
-        mc.progressWindow(
-            edit=True, progress=int(self.curStatus),
-            status="Progress is " + str(int(self.curStatus)).zfill(2) + "% done"
-        )
-        self.__next()
+    def __getStatus(self, percent):
+        status = "Progress is " + str(percent).zfill(2) + "% done"
+        if self.phase is not None:
+            status = self.phase + ": " + status
+        return status
 
-    def __linuxPrint(self):
-        print("# Progress is " + str(int(self.curStatus)).zfill(2) + "% done")
-        self.__next()
+    def __windowsPrint(self, percent):
+        mc.progressWindow(edit=True, progress=percent, status=self.__getStatus(percent))
+
+    def __linuxPrint(self, percent):
+        print("# " + self.__getStatus(percent))
 
 
 class Timer:
-    # Not implemented yet
     def __init__(self):
-        self.startTime = time.clock()
+        self.startTime = time.perf_counter()
         self.logList = []
         self.paused = 0.0
         self.pauseState = False
 
         self.pauseStart = 0.0
-        self.pauseStop = 0.0
+
+    def elapsed(self):
+        """Seconds since start, without paused time"""
+        if self.pauseState:
+            return self.pauseStart - self.startTime - self.paused
+        return time.perf_counter() - self.startTime - self.paused
 
     def logTime(self, note):
-        self.logList.append(str(time.clock() - self.startTime - self.paused) + ": " + note)
+        self.logList.append(("%.4f" % self.elapsed()).rjust(10) + ": " + note)
 
     def printLog(self):
         for i in self.logList:
@@ -899,14 +3068,13 @@ class Timer:
 
     def pauseToggle(self):
         if self.pauseState:
-            self.pauseStart = time.clock()
-            self.logTime("Paused...")
+            self.paused += time.perf_counter() - self.pauseStart
             self.pauseState = False
-
-        elif not self.pauseState:
-            self.pauseStop = time.clock()
             self.logTime("Continuing")
-            self.paused = self.pauseStop - self.pauseStart
+
+        else:
+            self.logTime("Paused...")
+            self.pauseStart = time.perf_counter()
             self.pauseState = True
 
 
@@ -1024,7 +3192,7 @@ class PaieGUI:
             columnWidth3=(60, 80, 80), numberOfRadioButtons=2, label="Mode:", labelArray2=("Import", "Export"),
             select=self.mode, on1=lambda *args: self.setMode(1), on2=lambda *args: self.setMode(2)
         )
-        mc.button(label="Refresh Files", width=100, command=lambda *args: self.updateFilelist())
+        mc.button(label="Refresh Files", width=100, command=lambda *args: self.updateFilelist(refresh=True))
         mc.button(label="Add Tab", width=100, command=lambda *args: self.addNewTab())
         mc.button(label="Remove Tab", width=100, command=lambda *args: self.removeTab())
 
@@ -1284,7 +3452,7 @@ class PaieGUI:
                     mc.optionVar(stringValueAppend=(self.optVar_path, path))
 
                 self.setExportEnable()
-                self.updateFilelist()
+                self.updateFilelist(refresh=True)
 
                 self.setTabLabel()
                 mc.textField(self.uiPath_pathField[self.currentTab], edit=True, text=inputPath)
@@ -1351,6 +3519,7 @@ class PaieGUI:
                 )
                 if answer == "Yes":
                     os.remove(filepath)
+                    LibraryIndex.get(dirPath, self.fileExt).remove(filename)
                     curSel = \
                         mc.textScrollList(self.uiPath_fileList[self.currentTab], query=True, selectIndexedItem=True)[0]
                     mc.textScrollList(self.uiPath_fileList[self.currentTab], edit=True, removeItem=filename)
@@ -1368,20 +3537,18 @@ class PaieGUI:
         else:
             print("# deleteSelectedFile >> file doesn't exist: " + filepath)
 
-    def listPaieFiles(self):
-        """Returns a list of all files in current tab path names *[self.fileExt]"""
+    def listPaieFiles(self, refresh=False):
+        """
+        Returns a list of all files in current tab path names *[self.fileExt]
+        The directory is read through its LibraryIndex and only rescanned on refresh or first visit
+        """
         path = self.getCurrentPath()
 
         if os.path.isdir(path):
-            dirFiles = os.listdir(path)
-            paieFiles = []
-            for entry in dirFiles:
-                extSplit = os.path.splitext(entry)
-                if extSplit[1] == self.fileExt:
-                    paieFiles.append(extSplit[0])
-
-            paieFiles.sort()
-            return paieFiles
+            libraryIndex = LibraryIndex.get(path, self.fileExt)
+            if refresh or not libraryIndex.scanned:
+                libraryIndex.refresh()
+            return libraryIndex.listFiles()
         else:
             print("# PaieGUI.listPaieFiles >> No directory matching path")
             return []
@@ -1434,11 +3601,11 @@ class PaieGUI:
                 print("WTF", self.uiPath_namespaceList)
                 print("WAH", self.uiPath_namespaceList[self.currentTab])
 
-                wrapperObj = DataWrapper()
-                loadVal = wrapperObj.load(path + "/" + selFile + self.fileExt)
-                if loadVal:
-                    namespaces = wrapperObj.dataObj.listNamespaces()
-                    fileInfo = wrapperObj.dataObj.listHeader()
+                # Data is only loaded in full when importing
+                entry = LibraryIndex.get(path, self.fileExt).getEntry(selFile)
+                if entry is not None and entry['header'] is not None:
+                    namespaces = entry['namespaces']
+                    fileInfo = DataContainer({'header': entry['header'], 'data': {}}).listHeader()
 
                     mc.textScrollList(self.uiPath_namespaceList[self.currentTab], edit=True, removeAll=True)
                     if len(namespaces) == 1:
@@ -1462,7 +3629,7 @@ class PaieGUI:
                     mc.scrollField(
                         self.uiPath_fileInfo[self.currentTab], edit=True,
                         insertText="Unsupported Version \nThis file cannot be used\nFile Version:\t" + str(
-                            wrapperObj.loadedVersion
+                            entry['structVersion'] if entry is not None else None
                         )
                     )
 
@@ -1471,12 +3638,12 @@ class PaieGUI:
         else:
             print("# paieGUI.fileSelected >> FileSelected run without selection.")
 
-    def updateFilelist(self):
-        paieFiles = self.listPaieFiles()
+    def updateFilelist(self, refresh=False):
+        paieFiles = self.listPaieFiles(refresh)
         if paieFiles != 0:
             mc.textScrollList(self.uiPath_fileList[self.currentTab], edit=True, removeAll=True)
-            for f in paieFiles:
-                mc.textScrollList(self.uiPath_fileList[self.currentTab], edit=True, append=f)
+            if paieFiles:
+                mc.textScrollList(self.uiPath_fileList[self.currentTab], edit=True, append=paieFiles)
 
     def tabChanged(self):
         selectedTab = mc.tabLayout(self.uiPath_tabs, q=True, selectTabIndex=True)
@@ -1534,6 +3701,27 @@ class PaieGUI:
             print(e)
 
 
+def askUser(policy, **dialogArgs):
+    """
+    mc.confirmDialog(**dialogArgs), unless paie.dialogPolicies is set. Then the answer of the policy,
+    or the default button, is returned without asking and the dialog is logged to paie.dialogLog
+    """
+    if dialogPolicies is None:
+        return mc.confirmDialog(**dialogArgs)
+
+    answer = dialogPolicies.get(policy, dialogArgs.get('defaultButton', dialogArgs.get('button')))
+    if isinstance(answer, list):
+        answer = answer[0]
+
+    message = dialogArgs.get('message', '')
+    if isinstance(message, tuple):
+        message = "".join(message)
+
+    dialogLog.append({'policy': policy, 'message': message, 'answer': answer})
+    print("# askUser >> " + policy + ": " + str(answer))
+    return answer
+
+
 def __fixPath(filePath):
     # try:
     #     filePath.decode("ascii")
@@ -1573,9 +3761,9 @@ def __checkFile(filePath):
     proceed = os.path.isfile(filePath)
 
     if proceed == 1:
-        proceed = mc.confirmDialog(
-            title="File exist", message="File already exist. Overwrite it?", button=["Yes", "No"], defaultButton="Yes",
-            cancelButton="No", dismissString="No"
+        proceed = askUser(
+            'overwriteFile', title="File exist", message="File already exist. Overwrite it?", button=["Yes", "No"],
+            defaultButton="Yes", cancelButton="No", dismissString="No"
         )
 
     if proceed == "Yes" or proceed == 0:
@@ -1608,59 +3796,64 @@ def __getSelection():
         return 0
 
 
-def __checkForClashingNames(selList):
-    if type(selList) != type([]):
-        raise Exception("# checkForClashingNames >> Input isn't a list")
+def __checkForClashingNames(selIndex):
+    if not isinstance(selIndex, SelectionIndex):
+        raise Exception("# checkForClashingNames >> Input isn't a SelectionIndex")
 
-    nameList = []
-    for j in selList:
-        nameList.append(j.split("|")[-1])
-
-    nameListSet = list(set(nameList))
-    if len(nameList) != len(nameListSet):
-
-        clashedNames = ''
-        d = []
-        for i in nameList:
-            if i in d:
-                clashedNames += i + "\n"
-            else:
-                d.append(i)
+    clashedNames = selIndex.listClashingNames()
+    if clashedNames:
         raise Exception(
-            "# checkForClashingNames >> Selection contains non-unique naming. This isn't tollerated\n" + clashedNames
+            "# checkForClashingNames >> Selection contains non-unique naming. This isn't tollerated\n"
+            + "\n".join(clashedNames) + "\n"
         )
 
     return 1
 
 
-def __checkNamespaceCount(selList):
+def __checkNamespaceCount(selIndex):
     # checking namespace count in selection
-    namespaceList = []
-    iter = range(0, len(selList))
-    for i in iter:
-
-        objWithNamespace = selList[i].split("|")[-1]  # gets last obj in path
-        split = objWithNamespace.split(":")
-
-        if len(split) != 1:
-            # get whole namespace
-            objName = objWithNamespace.split(":")[-1]  # strips obj from namespace
-            nSpace = objWithNamespace[: len(objName) * -1]  # gets full namespace
-
-            if nSpace not in namespaceList:
-                namespaceList.append(nSpace)
-        else:
-            if 'none' not in namespaceList:
-                namespaceList.append("none")
+    namespaceList = selIndex.listNamespaces()
 
     if len(namespaceList) > 1:
         print("# paie.__checkNamespaceCount >> List of namespaces: ", namespaceList)
         raise Exception("# importData >> Importing onto multiple namespaces is not supported. Check your selection")
 
 
+def __suspendScene(fastState, disableUndo=False):
+    """
+    Suspends viewport refresh, switches the evaluation manager to paie.fastEvaluationMode and optionally
+    turns off undo. Previous states are kept in fastState for __restoreScene as they're changed
+    """
+    mc.refresh(suspend=True)
+    fastState['refresh'] = True
+
+    if fastEvaluationMode is not None and hasattr(mc, 'evaluationManager'):
+        evaluationMode = mc.evaluationManager(query=True, mode=True)[0]
+        if evaluationMode != fastEvaluationMode:
+            fastState['evaluationMode'] = evaluationMode
+            mc.evaluationManager(mode=fastEvaluationMode)
+
+    if disableUndo:
+        fastState['undo'] = mc.undoInfo(query=True, state=True)
+        mc.undoInfo(stateWithoutFlush=False)
+
+
+def __restoreScene(fastState):
+    if 'undo' in fastState:
+        mc.undoInfo(stateWithoutFlush=fastState.pop('undo'))
+
+    if 'evaluationMode' in fastState:
+        mc.evaluationManager(mode=fastState.pop('evaluationMode'))
+
+    if fastState.pop('refresh', False):
+        mc.refresh(suspend=False)
+        mc.refresh(force=True)
+
+
 def exportData(
         filePath, dataType, attrsType='keyable', exportTimeline=1, startFrame=None, endFrame=None, objs=None,
-        userInput=None
+        userInput=None, useApi=None, fileFormat=None, stream=False, compression=None, fast=False, disableUndo=False,
+        splitNamespaces=False
 ):
     """
     filepath: full path and filename to export to
@@ -1669,7 +3862,20 @@ def exportData(
     startFrame: first frame to export
     endFrame: last frame to export
     userInput: possible user comments on the exported file
+    useApi: 1 = read animCurves through OpenMaya, 0 = maya.cmds only (Defaults to paie.apiEngine)
+    fileFormat: 1 = pickled, 2 = indexed binary format (Defaults to paie.saveFormat)
+    stream: write each object to disk as soon as it's sampled, keeping memory use down to one object.
+            Always writes the indexed binary format
+    compression: 'none', 'zlib' or 'lzma' compression for the binary format (Defaults to paie.saveCompression)
+    fast: suspend viewport refresh and the evaluation manager (see paie.fastEvaluationMode) while exporting.
+          compareFastMode reports the time it saves
+    disableUndo: with fast, also turn undo off while exporting
+    splitNamespaces: write one file per namespace in the selection, named <filePath>_<namespace>.xad
+            (namespace without ':'), from a single pass over the selection. Files are written in the background
+            while the next namespace is sampled. stream is ignored
     """
+    timer = Timer()
+    fastState = {}
     try:
         # Checking userInput for non-unicode characters
         if userInput is not None:
@@ -1700,7 +3906,8 @@ def exportData(
             if objs == 0:
                 raise Exception("# exportData >> You need to make a selection")
 
-        __checkForClashingNames(objs)
+        selIndex = SelectionIndex(objs)
+        __checkForClashingNames(selIndex)
 
         if exportTimeline == 1:
             if startFrame is None:
@@ -1715,49 +3922,160 @@ def exportData(
 
         fixedPath = __fixPath(filePath)
 
-        if __checkFile(fixedPath) == 'Yes':
+        if splitNamespaces:
+            basePath = os.path.splitext(fixedPath)[0]
+            namespacePaths = {}
+            for namespace in selIndex.listNamespaces():
+                namespacePath = __fixPath(basePath + "_" + namespace.strip(":").replace(":", "_"))
+                if __checkFile(namespacePath) == 'Yes':
+                    namespacePaths[namespace] = namespacePath
+                else:
+                    print("# exportData >> Skipping namespace " + namespace)
 
-            wrapperObj = DataWrapper()
+            if not namespacePaths:
+                print("# exportData >> Export was cancelled")
+                return 0
+
+            if fast:
+                __suspendScene(fastState, disableUndo)
+                timer.logTime("Scene suspended")
+
+            wrapperObj = DataWrapper(useApi)
+            writtenFiles = wrapperObj.getDataSplit(
+                objs, startFrame, endFrame, dataType, attrsType, userInput, namespacePaths, fileFormat, compression,
+                selIndex
+            )
+            wrapperObj.clear()
+
+            # Binary headers are read without decoding anything. Pickles are indexed from what was written
+            for writtenPath, contents in writtenFiles:
+                dirPath, filename = os.path.split(writtenPath)
+                LibraryIndex.get(dirPath).update(
+                    os.path.splitext(filename)[0], contents if (fileFormat or saveFormat) != 2 else None
+                )
+            timer.logTime("Exported " + str(len(writtenFiles)) + " files")
+
+        elif __checkFile(fixedPath) == 'Yes':
+
+            if fast:
+                __suspendScene(fastState, disableUndo)
+                timer.logTime("Scene suspended")
+
+            wrapperObj = DataWrapper(useApi)
+            contents = None
 
-            if wrapperObj.getData(objs, startFrame, endFrame, dataType, attrsType, userInput):
-                wrapperObj.save(fixedPath)
+            if stream:
+                if wrapperObj.getData(
+                        objs, startFrame, endFrame, dataType, attrsType, userInput, fixedPath, compression, selIndex
+                ):
+                    wrapperObj.clear()
+                else:
+                    raise Exception("# exportData >> Could not get any data from selected objects")
+
+            elif wrapperObj.getData(
+                    objs, startFrame, endFrame, dataType, attrsType, userInput, selIndex=selIndex
+            ):
+                # Pickles are indexed from what is written, binary headers are read without decoding anything
+                if (fileFormat or saveFormat) != 2:
+                    contents = wrapperObj.getIndexContents()
+
+                progress = ProgressHandler(len(objs), "Exporting Data", "write")
+                try:
+                    wrapperObj.save(fixedPath, fileFormat, compression, progress=progress)
+                finally:
+                    progress.finish()
                 wrapperObj.clear()
             else:
                 raise Exception("# exportData >> Could not get any data from selected objects")
 
+            dirPath, filename = os.path.split(fixedPath)
+            LibraryIndex.get(dirPath).update(os.path.splitext(filename)[0], contents)
+            timer.logTime("Exported " + fixedPath)
+
         else:
             print("# exportData >> Export was cancelled")
-    except Exception as e:
-        mc.confirmDialog(title='Error', message=e.__str__(), button='OK')
+            return 0
+    except (Exception, KeyboardInterrupt) as e:
+        askUser('error', title='Error', message=e.__str__(), button='OK')
         print("# PAIE.Error >> Here's the deal:")
         traceback.print_exc()
         return 0
     except UnicodeError:
-        mc.confirmDialog(
-            title='Error', message="# exportData >> Non-unicode characters aren't supported. Stop using them!",
-            button='OK'
+        askUser(
+            'error', title='Error',
+            message="# exportData >> Non-unicode characters aren't supported. Stop using them!", button='OK'
         )
         return 0
+    finally:
+        if fastState:
+            __restoreScene(fastState)
+            timer.logTime("Scene restored")
+        if fast or debugger == 2:
+            print("# exportData >> Timings" + (" (fast mode)" if fast else "") + ":")
+            timer.printLog()
+
+    return 1
 
 
-def importData(filepath, selectOrder, startFrame=None, namespace="none", applyAtOrigin=None, selList=None):
+def importData(
+        filepath, selectOrder, startFrame=None, namespace="none", applyAtOrigin=None, selList=None, useApi=None,
+        fast=False, disableUndo=False, multiTarget=False, instanceMode=None
+):
     """
     Filepath:     	full path to .xad file
     selectOrder:  	bool argument setting selection Order mode on/off
     Startframe:   	frame number on which to import the file data (Defaults to current frame)
     namespace:    	namespace in file to import from (Defaults to 'none')
     selList:      	selection list input for commandline usage (defaults to current selection)
+    useApi:       	1 = write animCurves through OpenMaya, 0 = maya.cmds only (Defaults to paie.apiEngine)
+    fast:         	suspend viewport refresh and the evaluation manager (see paie.fastEvaluationMode)
+                  	while importing. compareFastMode reports the time it saves
+    disableUndo:  	with fast, also turn undo off while importing. For batch runs, the import can't be undone
+    multiTarget:  	apply the clip to every namespace in the selection, loading it once and writing all
+                  	targets in one pass. With selectOrder, objects are matched in selection order per namespace
+    instanceMode: 	None, "shared" or "duplicate". Implies multiTarget. Each animCurve is built once and then
+                  	connected to the other targets ("shared", one live curve) or duplicated for them ("duplicate")
     """
-    if debugger == 2:
-        print("# import start: ".ljust(30), time.clock())
-
+    timer = Timer()
+    fastState = {}
     try:
         fixedPath = __fixPath(filepath)
-        wrapperObj = DataWrapper()
+        wrapperObj = DataWrapper(useApi)
+
+        if selList is None:
+            selList = __getSelection()
+
+        if selList == 0:
+            raise Exception("# importData >> Selection list is empty. Select some objects to import on, please")
+
+        if instanceMode not in (None, "shared", "duplicate"):
+            raise Exception("# importData >> Unknown instanceMode: " + str(instanceMode))
+        if instanceMode:
+            multiTarget = True
+
+        selIndex = SelectionIndex(selList)
+
+        __checkForClashingNames(selIndex)
+
+        if not multiTarget:
+            __checkNamespaceCount(selIndex)
 
-        if not wrapperObj.load(fixedPath):
+        # Only objects matching the selection by name are needed, unless matching on selection order
+        objNames = None
+        if not selectOrder:
+            objNames = list(dict.fromkeys(selIndex.shortNames))
+
+        if fast:
+            __suspendScene(fastState, disableUndo)
+            timer.logTime("Scene suspended")
+
+        if not wrapperObj.loadCached(fixedPath, namespace, objNames):
             print("# importData >> File was empty. Wtf?!")
         else:
+            timer.logTime("Loaded " + fixedPath)
+            if debugger:
+                ClipCache.printStats()
+
             if startFrame is None:
                 if applyAtOrigin:
                     startFrame = wrapperObj.dataObj.getHeaderAttr('startframe')
@@ -1765,17 +4083,8 @@ def importData(filepath, selectOrder, startFrame=None, namespace="none", applyAt
                 else:
                     startFrame = mc.currentTime(query=True)
 
-            if selList is None:
-                selList = __getSelection()
-
-            if selList == 0:
-                raise Exception("# importData >> Selection list is empty. Select some objects to import on, please")
-
-            __checkForClashingNames(selList)
-
-            __checkNamespaceCount(selList)
-
             # Disable autoKeyframe (waste of time if enabled)
+            undoState = mc.undoInfo(query=True, state=True)
             if wrapperObj.dataObj.getHeaderAttr('filetype') == 'anim':
                 try:
                     mc.undoInfo(stateWithoutFlush=False)
@@ -1784,12 +4093,16 @@ def importData(filepath, selectOrder, startFrame=None, namespace="none", applyAt
                     mc.autoKeyframe(state=0)
 
                 finally:
-                    mc.undoInfo(stateWithoutFlush=True)
+                    mc.undoInfo(stateWithoutFlush=undoState)
 
-            # Writing to scene!
+            # Writing to scene! Whatever maya.cmds has to do besides the PaieApiEdit ends up in the same undo step
+            mc.undoInfo(openChunk=True, chunkName="paieImport")
             try:
-                wrapperObj.writeToScene(selList, selectOrder, namespace, startFrame)
+                wrapperObj.writeToScene(
+                    selList, selectOrder, namespace, startFrame, selIndex, multiTarget, instanceMode
+                )
             finally:
+                mc.undoInfo(closeChunk=True)
                 # Enable autoKeyframe if it was previously enabled
                 if wrapperObj.dataObj.getHeaderAttr('filetype') == 'anim':
                     if autoKeyState == 1:
@@ -1798,22 +4111,389 @@ def importData(filepath, selectOrder, startFrame=None, namespace="none", applyAt
                             mc.autoKeyframe(state=1)
 
                         finally:
-                            mc.undoInfo(stateWithoutFlush=True)
+                            mc.undoInfo(stateWithoutFlush=undoState)
                 wrapperObj.dataObj.clear()
                 wrapperObj.clear()
 
-            if debugger == 2:
-                print("# import end: ".ljust(30), time.clock())
+            timer.logTime("Written to scene")
 
     except (Exception, KeyboardInterrupt) as e:
         traceback.print_exc()
-        mc.confirmDialog(title='Error', message=e.__str__(), button='OK')
+        askUser('error', title='Error', message=e.__str__(), button='OK')
         return 0
 
     else:
         print("# Import was successfull")
         return 1
 
+    finally:
+        if fastState:
+            __restoreScene(fastState)
+            timer.logTime("Scene restored")
+        if fast or debugger == 2:
+            print("# importData >> Timings" + (" (fast mode)" if fast else "") + ":")
+            timer.printLog()
+
+
+def benchmarkFormats(filepath, repeat=5):
+    """
+    Compares file size, save and load time of the pickled format and the indexed binary format, uncompressed
+    and with each compression, using the data in filepath. Files are written to a temp dir.
+    Prints a table and returns the results as a dict
+    """
+    variants = [('pickle', 1, None)]
+    for compression in XadWriter.compressionMethods:
+        variants.append(('binary ' + str(compression or 'none'), 2, compression or 'none'))
+
+    results = {}
+    tempDir = tempfile.mkdtemp(prefix="paieBenchmark")
+    try:
+        for label, fileFormat, compression in variants:
+            wrapperObj = DataWrapper()
+            if not wrapperObj.load(filepath):
+                raise Exception("# benchmarkFormats >> Could not load " + filepath)
+
+            formatPath = os.path.join(tempDir, str(len(results)) + ".xad")
+            saveStart = time.perf_counter()
+            wrapperObj.save(formatPath, fileFormat, compression)
+            saveTime = time.perf_counter() - saveStart
+
+            loadTimes = []
+            readTimes = []
+            for i in range(repeat):
+                loadStart = time.perf_counter()
+                wrapperObj = DataWrapper()
+                wrapperObj.load(formatPath)
+                loadTimes.append(time.perf_counter() - loadStart)
+
+                # Touching every key, as the uncompressed binary format only maps keys on load
+                for namespace in wrapperObj.dataObj.listNamespaces():
+                    wrapperObj.dataObj.setDefaultNamespace(namespace)
+                    for objID in wrapperObj.dataObj.getObjIdDict():
+                        for attr in wrapperObj.dataObj.listObjAttrs(objID):
+                            if wrapperObj.dataObj.hasAnim(objID, attr):
+                                sum(wrapperObj.dataObj.getAnimKeys(objID, attr).value)
+                readTimes.append(time.perf_counter() - loadStart)
+                wrapperObj.dataObj.clear()
+                wrapperObj.clear()
+
+            results[label] = {
+                'size': os.path.getsize(formatPath), 'save': saveTime, 'load': min(loadTimes),
+                'loadAndRead': min(readTimes),
+            }
+    finally:
+        shutil.rmtree(tempDir, ignore_errors=True)
+
+    print("# benchmarkFormats >> " + filepath)
+    print("format".ljust(14) + "size (kB)".rjust(12) + "save (s)".rjust(12) + "load (s)".rjust(12)
+          + "load+read (s)".rjust(16))
+    for label in results:
+        result = results[label]
+        print(
+            label.ljust(14) + ("%.1f" % (result['size'] / 1024.0)).rjust(12) + ("%.4f" % result['save']).rjust(12)
+            + ("%.4f" % result['load']).rjust(12) + ("%.4f" % result['loadAndRead']).rjust(16)
+        )
+
+    return results
+
+
+def compareFastMode(importPath, selList, namespace="none", startFrame=None, selectOrder=0):
+    """
+    Times exporting selList and importing importPath onto it, once normally and once with fast=True, and reports
+    the time fast mode saves. Runs without dialogs, exports go to a temp dir and imports are undone afterwards,
+    so both runs start from the same scene. Prints a table and returns operation -> {'normal': s, 'fast': s}
+    """
+    global dialogPolicies, dialogLog
+
+    results = {'export': {}, 'import': {}}
+    dialogPolicies = dict(batchDialogPolicies)
+    dialogLog = []
+    tempDir = tempfile.mkdtemp(prefix="paieFastMode")
+    try:
+        for fast in (False, True):
+            label = "fast" if fast else "normal"
+
+            exportStart = time.perf_counter()
+            status = exportData(os.path.join(tempDir, label + ".xad"), 'anim', objs=selList, fast=fast)
+            results['export'][label] = time.perf_counter() - exportStart
+            if not status:
+                raise Exception("# compareFastMode >> Export failed with fast=" + str(fast))
+
+            # Both imports load the file from disk
+            ClipCache.invalidate(importPath)
+            importStart = time.perf_counter()
+            status = importData(importPath, selectOrder, startFrame, namespace, selList=selList, fast=fast)
+            results['import'][label] = time.perf_counter() - importStart
+            if not status:
+                raise Exception("# compareFastMode >> Import failed with fast=" + str(fast))
+            mc.undo()
+    finally:
+        dialogPolicies = None
+        shutil.rmtree(tempDir, ignore_errors=True)
+
+    print("# compareFastMode >> " + str(len(selList)) + " objects, " + importPath)
+    print("operation".ljust(12) + "normal (s)".rjust(12) + "fast (s)".rjust(12) + "saved (s)".rjust(12)
+          + "saved".rjust(8))
+    for operation in results:
+        normal = results[operation]['normal']
+        fast = results[operation]['fast']
+        print(operation.ljust(12) + ("%.4f" % normal).rjust(12) + ("%.4f" % fast).rjust(12)
+              + ("%.4f" % (normal - fast)).rjust(12) + ("%.0f%%" % ((normal - fast) / normal * 100)).rjust(8))
+
+    return results
+
+
+def compareInstancing(filepath, selList, namespace="none", startFrame=None, selectOrder=0,
+                      modes=(None, "shared", "duplicate")):
+    """
+    Times importing filepath onto every namespace in selList with each instanceMode, None being the normal
+    per target import. Each import runs in fast mode without dialogs and is undone afterwards, so all modes
+    start from the same scene. Prints a table and returns mode -> seconds
+    """
+    global dialogPolicies, dialogLog
+
+    results = {}
+    dialogPolicies = dict(batchDialogPolicies)
+    dialogLog = []
+    try:
+        for instanceMode in modes:
+            importStart = time.perf_counter()
+            status = importData(
+                filepath, selectOrder, startFrame, namespace, selList=selList, fast=True, multiTarget=True,
+                instanceMode=instanceMode
+            )
+            results[str(instanceMode or "none")] = time.perf_counter() - importStart
+
+            if not status:
+                raise Exception("# compareInstancing >> Import failed with instanceMode " + str(instanceMode))
+            mc.undo()
+    finally:
+        dialogPolicies = None
+
+    print("# compareInstancing >> " + filepath + ", " + str(len(SelectionIndex(selList).listNamespaces()))
+          + " namespaces")
+    print("instanceMode".ljust(14) + "import (s)".rjust(12) + "speedup".rjust(10))
+    for label in results:
+        print(label.ljust(14) + ("%.4f" % results[label]).rjust(12)
+              + ("%.2fx" % (list(results.values())[0] / results[label])).rjust(10))
+
+    return results
+
+
+def __initializeStandalone():
+    # maya.cmds is empty in mayapy until Maya is initialized
+    if not hasattr(mc, 'file'):
+        import maya.standalone
+        maya.standalone.initialize(name='python')
+
+
+def loadManifest(manifestPath):
+    """
+    Reads a batch manifest: a json list of jobs, or {"jobs": [...], "policies": {policy: answer}}.
+    A job is a dict of
+        operation:      'export' or 'import'
+        scene:          scene file to open
+        file:           .xad file to export to or import from
+        selection:      object names or wildcard patterns, f.x. ["char1:*_ctrl"]
+        startFrame:     optional. export: first frame (Defaults to the scene's playback range), import: frame to
+                        import on (Defaults to the current frame)
+        endFrame:       optional, export only
+        dataType:       optional, export only. 'anim'/'pose' (Defaults to 'anim')
+        attrsType:      optional, export only. 'keyable'/'all' (Defaults to 'keyable')
+        comments:       optional, export only
+        namespace:      optional, import only. namespace in the file (Defaults to 'none')
+        selectOrder:    optional, import only. match on selection order instead of names
+        applyAtOrigin:  optional, import only
+        multiTarget:    optional, import only. apply the clip to every namespace in the selection
+        instanceMode:   optional, import only. "shared" or "duplicate", see importData
+        saveScene:      optional, import only. true to save the scene, or a path to save it as
+    Returns (jobs, policies)
+    """
+    with open(manifestPath, 'r') as file:
+        manifest = json.load(file)
+
+    policies = {}
+    if isinstance(manifest, dict):
+        policies = manifest.get('policies', {})
+        manifest = manifest.get('jobs', [])
+
+    for i, job in enumerate(manifest):
+        if job.get('operation') not in ('export', 'import'):
+            raise Exception("# loadManifest >> Job " + str(i) + ": 'operation' should be either 'export' or 'import'")
+        for key in ('scene', 'file', 'selection'):
+            if not job.get(key):
+                raise Exception("# loadManifest >> Job " + str(i) + ": '" + key + "' missing")
+
+    return manifest, policies
+
+
+def verifyExport(filepath):
+    """
+    True if filepath loads in a regular session, where this module is imported as paie. Pickles written while it
+    runs under another name (f.x. __main__ or __mp_main__) point at classes such sessions don't have
+    """
+    import paie as paieModule
+
+    wrapperObj = paieModule.DataWrapper()
+    return bool(wrapperObj.load(filepath)) and isinstance(wrapperObj.dataObj, paieModule.DataContainer)
+
+
+def runBatchJob(job, policies=None):
+    """
+    Runs a single manifest job without dialogs. Used by runBatch in its worker processes, starting Maya
+    standalone when needed. Returns a result dict of status, error, answered dialogs and timings in seconds
+    """
+    global dialogPolicies, dialogLog
+
+    jobStart = time.perf_counter()
+    timings = {}
+    __initializeStandalone()
+    timings['initialize'] = time.perf_counter() - jobStart
+
+    dialogPolicies = dict(batchDialogPolicies)
+    dialogPolicies.update(policies or {})
+    dialogLog = []
+    try:
+        phaseStart = time.perf_counter()
+        mc.file(job['scene'], open=True, force=True, prompt=False)
+        timings['open'] = time.perf_counter() - phaseStart
+
+        selList = mc.ls(job['selection'], long=True)
+        if not selList:
+            raise Exception("# runBatchJob >> Selection matches no objects: " + str(job['selection']))
+
+        phaseStart = time.perf_counter()
+        if job['operation'] == 'export':
+            status = exportData(
+                job['file'], job.get('dataType', 'anim'), job.get('attrsType', 'keyable'), 1, job.get('startFrame'),
+                job.get('endFrame'), selList, job.get('comments'), fast=True, disableUndo=True
+            )
+            if status and not verifyExport(__fixPath(job['file'])):
+                raise Exception("# runBatchJob >> Exported file doesn't load in a paie session: " + job['file'])
+        else:
+            status = importData(
+                job['file'], job.get('selectOrder', 0), job.get('startFrame'), job.get('namespace', "none"),
+                job.get('applyAtOrigin'), selList, fast=True, disableUndo=True,
+                multiTarget=job.get('multiTarget', False), instanceMode=job.get('instanceMode')
+            )
+        timings['run'] = time.perf_counter() - phaseStart
+
+        saveScene = job.get('saveScene')
+        if status and saveScene:
+            phaseStart = time.perf_counter()
+            if saveScene is not True:
+                mc.file(rename=saveScene)
+            mc.file(save=True, force=True)
+            timings['save'] = time.perf_counter() - phaseStart
+
+        errors = [dialog['message'] for dialog in dialogLog if dialog['policy'] == 'error']
+        result = {'status': "ok" if status else "failed", 'error': "\n".join(errors)}
+    except Exception as e:
+        traceback.print_exc()
+        result = {'status': "failed", 'error': e.__str__()}
+    finally:
+        dialogPolicies = None
+
+    timings['total'] = time.perf_counter() - jobStart
+    result.update({'dialogs': dialogLog, 'timings': timings, 'pid': os.getpid()})
+    return result
+
+
+def runBatch(jobs, workers=None, reportPath=None, worker=None, policies=None):
+    """
+    Distributes jobs over a pool of worker processes and collects a result per job.
+    jobs:       list of job dicts as returned by loadManifest
+    workers:    number of worker processes (Defaults to one per job, up to the cpu count)
+    reportPath: json file to write the report to
+    worker:     worker(job, policies) returning a result dict (Defaults to runBatchJob). Must be picklable,
+                as workers are spawned processes
+    policies:   dialog policies on top of paie.batchDialogPolicies
+    Returns the report: {'workers', 'total', 'results': [result per job, in manifest order]}
+    """
+    # Imported here, to keep them out of the startup of interactive sessions and offline tools
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    if worker is None:
+        worker = runBatchJob
+    if workers is None:
+        workers = min(len(jobs), os.cpu_count() or 1)
+    workers = max(1, workers)
+
+    batchStart = time.perf_counter()
+    results = [None] * len(jobs)
+
+    # Maya doesn't survive forking, so workers are always spawned
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {}
+        for i, job in enumerate(jobs):
+            futures[pool.submit(worker, job, policies)] = i
+
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                result = dict(future.result())
+            except Exception as e:
+                # Includes workers that died, which fails every job still queued on the pool
+                result = {'status': "failed", 'error': repr(e)}
+
+            result['job'] = i
+            result['operation'] = jobs[i].get('operation')
+            result['file'] = jobs[i].get('file')
+            result['finished'] = time.perf_counter() - batchStart
+            results[i] = result
+
+            print("# runBatch >> [" + str(len(futures) - sum(r is None for r in results)) + "/" + str(len(jobs))
+                  + "] " + result['status'] + ": " + str(result['operation']) + " " + str(result['file']))
+
+    report = {'workers': workers, 'total': time.perf_counter() - batchStart, 'results': results}
+
+    if reportPath is not None:
+        with open(reportPath, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    failed = [result for result in results if result['status'] != "ok"]
+    print("# runBatch >> " + str(len(jobs) - len(failed)) + " of " + str(len(jobs)) + " jobs ok in "
+          + ("%.1f" % report['total']) + "s on " + str(workers) + " workers")
+    for result in failed:
+        print("### Job " + str(result['job']) + " failed: " + str(result.get('error')))
+
+    return report
+
+
+def main(argv=None):
+    """Command line entry point: mayapy -m paie batch manifest.json"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="paie")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    batchParser = subparsers.add_parser('batch', help="run the export/import jobs of a json manifest")
+    batchParser.add_argument('manifest', help="json manifest, see paie.loadManifest")
+    batchParser.add_argument('--workers', type=int, default=None, help="number of worker processes")
+    batchParser.add_argument('--report', default=None, help="json report path (Defaults to <manifest>.report.json)")
+    batchParser.add_argument(
+        '--policy', action='append', default=[], metavar="NAME=ANSWER",
+        help="answer to a dialog, f.x. overwriteFile=No. Can be given multiple times"
+    )
+
+    args = parser.parse_args(argv)
+
+    jobs, policies = loadManifest(args.manifest)
+    for policy in args.policy:
+        name, answer = policy.split("=", 1)
+        policies[name] = answer
+
+    reportPath = args.report
+    if reportPath is None:
+        reportPath = os.path.splitext(args.manifest)[0] + ".report.json"
+
+    report = runBatch(jobs, args.workers, reportPath, policies=policies)
+    print("# paie >> Report written to: " + reportPath)
+
+    return int(any(result['status'] != "ok" for result in report['results']))
+
 
 def GUI():
     global gGuiRef
@@ -1825,3 +4505,10 @@ def GUI():
         print(e)
         traceback.print_exc()
         print("# paie.GUI >> Caught by GUI()")
+
+
+if __name__ == "__main__":
+    # Run from the importable module, so batch workers and the classes they pickle resolve as paie.*
+    import paie
+
+    sys.exit(paie.main())